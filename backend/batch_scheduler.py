@@ -0,0 +1,96 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# Collects concurrent single-document requests and runs them through `process_batch` as one
+# batch. A batch is flushed when it reaches `max_batch_size`, when the oldest request has
+# waited `max_wait_ms`, or as soon as every request currently in flight is in the batch, so
+# a lone request is never held back waiting for company.
+class MicroBatcher:
+    def __init__(self, process_batch, max_batch_size=32, max_wait_ms=5):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._pid = None
+        self._queue = None
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    # The worker thread is started lazily and restarted after a fork, since threads do not
+    # survive into preforked worker processes
+    def _ensure_worker(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._inflight = 0
+            worker = threading.Thread(target=self._run, args=(self._queue,), name="micro-batcher", daemon=True)
+            worker.start()
+            self._pid = os.getpid()
+
+    # Block until the item's result is ready and return it (exceptions are re-raised)
+    def submit(self, item, timeout=None):
+        self._ensure_worker()
+        future = Future()
+        with self._lock:
+            self._inflight += 1
+        self._queue.put((item, future))
+        return future.result(timeout=timeout)
+
+    def _collect(self, work_queue):
+        batch = [work_queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            with self._lock:
+                waiting = self._inflight
+            if len(batch) >= waiting:
+                # Nobody else is waiting; flush instead of sleeping until the deadline
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(work_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, work_queue):
+        while True:
+            batch = self._collect(work_queue)
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+                error = None
+            except Exception as e:
+                results, error = None, e
+
+            with self._lock:
+                self._inflight -= len(batch)
+                self.batches += 1
+                self.items += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+
+            for index, (_, future) in enumerate(batch):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(results[index])
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0,
+            "largest_batch": self.largest_batch,
+        }
@@ -0,0 +1,73 @@
+import gc
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# Production entry point for the Flask API:
+#   gunicorn -c gunicorn.conf.py nlp_api:app
+# The app is imported and ipsee_ner_model loaded once in the master process, and the
+# workers are forked from it, so they share the model weights copy-on-write.
+
+bind = os.environ.get('IPSEE_BIND', '0.0.0.0:5000')
+
+# Workers share their metrics through this directory so /metrics reports all of them (set
+# before the app is imported; emptied when the server starts)
+os.environ.setdefault('IPSEE_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'ipsee_metrics'))
+
+# One worker per core by default; IPSEE_THREADS > 1 switches to threaded workers, which the
+# micro-batching scheduler needs to see concurrent requests inside a worker
+workers = int(os.environ.get('IPSEE_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('IPSEE_THREADS', 1))
+
+preload_app = True
+
+# Recycle workers gracefully: after max_requests (with jitter so they do not all restart at
+# once) a worker finishes its in-flight requests and the master forks a fresh one
+max_requests = int(os.environ.get('IPSEE_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('IPSEE_MAX_REQUESTS_JITTER', max_requests // 10))
+graceful_timeout = int(os.environ.get('IPSEE_GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('IPSEE_TIMEOUT', 60))
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    shutil.rmtree(os.environ['IPSEE_METRICS_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['IPSEE_METRICS_DIR'], exist_ok=True)
+
+
+# Write the worker's final metric values, so nothing counted since the last flush is lost
+def worker_exit(server, worker):
+    import metrics
+    metrics.REGISTRY.flush()
+
+
+# Called after the app has been preloaded and before any worker is forked. The model is
+# loaded and warmed up here, once. Moving every object loaded so far into the permanent
+# generation then keeps the garbage collector from touching (and thereby copying) the
+# model's pages in each worker.
+def when_ready(server):
+    import nlp_api
+    nlp_api.init_service()
+    gc.freeze()
+    server.log.info(f"Model loaded and warmed up in master; forking {workers} workers")
+
+
+# Without preload_app each worker loads its own copy; init_service() is a no-op otherwise
+def post_worker_init(worker):
+    import nlp_api
+    nlp_api.init_service()
+
+
+# Drain-then-restart on memory pressure: when the worker's memory guard trips (RSS above
+# IPSEE_RSS_HARD_MB, or the vocab grew by IPSEE_MAX_STRING_GROWTH strings) the worker stops
+# accepting requests, finishes the ones in flight and exits; the master then forks a fresh
+# worker from the pristine preloaded model, as with max_requests
+def post_request(worker, req, environ, resp):
+    import nlp_api
+    reason = nlp_api.memory_check()
+    if reason is not None and worker.alive:
+        worker.log.info(f"Recycling worker {worker.pid}: {reason}")
+        worker.alive = False
@@ -0,0 +1,131 @@
+import hashlib
+import re
+import threading
+from collections import namedtuple
+
+from result_cache import LRUCache
+
+# Only the labels the API reports on are cached per unit
+ENTITY_LABELS = ("VIOLATION", "ESSENTIAL_COOKIE", "MISLEADING_OPTION")
+
+# Lightweight stand-in for a spaCy Span with document-level character offsets
+Entity = namedtuple("Entity", ["text", "label_", "start_char", "end_char"])
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+# Split a document into stable units: one per line (paragraph), and paragraphs longer than
+# `max_unit_chars` further split at sentence ends. Sentences that are still too long are cut
+# at whitespace into windows without overlap, so no unit exceeds `max_unit_chars`. Returns
+# (start, end) offsets into `text` with surrounding whitespace trimmed, so an edit to one
+# paragraph leaves the others' hashes unchanged.
+def split_units(text, max_unit_chars=1000):
+    # long_document imports Entity from this module
+    from long_document import split_windows
+
+    sentences = []
+    for paragraph in re.finditer(r'[^\n]+', text):
+        start, end = paragraph.span()
+        if end - start <= max_unit_chars:
+            sentences.append((start, end))
+            continue
+        position = start
+        for boundary in SENTENCE_END.finditer(text, start, end):
+            sentences.append((position, boundary.start()))
+            position = boundary.end()
+        sentences.append((position, end))
+
+    spans = []
+    for start, end in sentences:
+        if end - start <= max_unit_chars:
+            spans.append((start, end))
+        else:
+            spans.extend((start + window_start, start + window_end)
+                         for window_start, window_end in split_windows(text[start:end], max_unit_chars, 0))
+
+    units = []
+    for start, end in spans:
+        chunk = text[start:end]
+        stripped = chunk.strip()
+        if stripped:
+            start += len(chunk) - len(chunk.lstrip())
+            units.append((start, start + len(stripped)))
+    return units
+
+
+# Runs NER only on units whose content hash has not been seen before and merges the
+# cached per-unit entities back into document offsets. Units never exceed nlp.max_length.
+# Counters are updated under a lock, since threaded workers share one analyzer.
+class IncrementalAnalyzer:
+    def __init__(self, nlp, cache=None, namespace='', batch_size=64, max_unit_chars=1000):
+        self.nlp = nlp
+        self.cache = cache if cache is not None else LRUCache(maxsize=100000, ttl=7 * 24 * 3600)
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.max_unit_chars = min(max_unit_chars, getattr(nlp, 'max_length', max_unit_chars))
+        self.units_seen = 0
+        self.units_processed = 0
+        self.chars_seen = 0
+        self.chars_processed = 0
+        self._lock = threading.Lock()
+
+    def unit_key(self, unit_text):
+        return hashlib.sha256(f"{self.namespace}\0{unit_text}".encode('utf-8')).hexdigest()
+
+    # Entities for every text, in order. Unseen units of all texts share one nlp.pipe call.
+    def entities_many(self, texts):
+        plans = []
+        unit_results = {}
+        pending = {}
+        units_seen = chars_seen = 0
+        for text in texts:
+            plan = []
+            for start, end in split_units(text, self.max_unit_chars):
+                unit_text = text[start:end]
+                key = self.unit_key(unit_text)
+                plan.append((start, key))
+                units_seen += 1
+                chars_seen += len(unit_text)
+                if key in unit_results or key in pending:
+                    continue
+                cached = self.cache.get(key)
+                if cached is not None:
+                    unit_results[key] = cached
+                else:
+                    pending[key] = unit_text
+            plans.append(plan)
+
+        keys = list(pending)
+        for key, doc in zip(keys, self.nlp.pipe((pending[key] for key in keys), batch_size=self.batch_size)):
+            # Offsets are stored relative to the unit so the entry is reusable at any position
+            ents = [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents if ent.label_ in ENTITY_LABELS]
+            self.cache.set(key, ents)
+            unit_results[key] = ents
+
+        with self._lock:
+            self.units_seen += units_seen
+            self.chars_seen += chars_seen
+            self.units_processed += len(keys)
+            self.chars_processed += sum(len(pending[key]) for key in keys)
+
+        results = []
+        for text, plan in zip(texts, plans):
+            entities = []
+            for offset, key in plan:
+                for start, end, label in unit_results[key]:
+                    entities.append(Entity(text[offset + start:offset + end], label, offset + start, offset + end))
+            results.append(entities)
+        return results
+
+    def entities(self, text):
+        return self.entities_many([text])[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self.cache),
+                "units_seen": self.units_seen,
+                "units_processed": self.units_processed,
+                "chars_seen": self.chars_seen,
+                "chars_processed": self.chars_processed,
+            }
@@ -0,0 +1,68 @@
+import re
+
+
+# Compile a keyword trie into one regular expression so that, at any text position, the
+# regex engine walks shared prefixes once instead of trying every keyword separately
+def _trie_pattern(node):
+    alternatives = []
+    for char in sorted(node):
+        if char == '':
+            continue
+        alternatives.append(re.escape(char) + _trie_pattern(node[char]))
+    if not alternatives:
+        return ''
+    body = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    # A keyword ends here but longer keywords continue: the greedy '?' keeps the longest one
+    if '' in node:
+        return '(?:' + body + ')?'
+    return body
+
+
+# Multi-pattern matcher built once from a {category: [keywords]} mapping. find_all() makes
+# a single left-to-right pass over the text and reports every occurrence of every keyword,
+# including overlapping ones, with character offsets into the original text. Matching is
+# case-insensitive substring matching, the same semantics as `keyword in text.lower()`.
+class KeywordMatcher:
+    def __init__(self, keywords_by_category):
+        self.categories_by_keyword = {}
+        for category, keywords in keywords_by_category.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword:
+                    self.categories_by_keyword.setdefault(keyword, []).append(category)
+
+        trie = {}
+        for keyword in self.categories_by_keyword:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = True
+
+        # Shorter keywords that start at the same position as a longer match
+        self.prefixes = {
+            keyword: [other for other in self.categories_by_keyword
+                      if other != keyword and keyword.startswith(other)]
+            for keyword in self.categories_by_keyword
+        }
+
+        # The lookahead makes every match zero-width so overlapping keywords are all found
+        self.pattern = re.compile('(?=(' + _trie_pattern(trie) + '))', re.IGNORECASE) if trie else None
+
+    # Every occurrence as (start, end, category, keyword), ordered by start offset
+    def find_all(self, text):
+        matches = []
+        if self.pattern is None or not text:
+            return matches
+        for match in self.pattern.finditer(text):
+            start = match.start(1)
+            keyword = match.group(1).lower()
+            if keyword not in self.categories_by_keyword:
+                continue
+            for found in [keyword] + self.prefixes[keyword]:
+                for category in self.categories_by_keyword[found]:
+                    matches.append((start, start + len(found), category, found))
+        return matches
+
+    # Set of categories with at least one occurrence in the text
+    def categories_found(self, text):
+        return {category for _, _, category, _ in self.find_all(text)}
@@ -0,0 +1,98 @@
+import bisect
+import re
+
+from incremental_ner import Entity
+
+# Where a new sentence may start: after sentence-ending punctuation or a line break
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+# Cut at the last whitespace before `limit` when a single sentence is longer than a window
+def _hard_break(text, start, limit):
+    position = max(text.rfind(' ', start + 1, limit), text.rfind('\n', start + 1, limit))
+    return position + 1 if position > start else limit
+
+
+# Split a long text into windows of at most `window_chars` characters that start and end at
+# sentence boundaries, each one overlapping the previous by up to `overlap_chars`. Returns
+# (start, end) offsets into `text`; a text that fits in one window is returned whole.
+def split_windows(text, window_chars=10000, overlap_chars=1000):
+    if len(text) <= window_chars:
+        return [(0, len(text))]
+    starts = [0] + [match.end() for match in SENTENCE_BREAK.finditer(text) if 0 < match.end() < len(text)]
+
+    windows = []
+    start = 0
+    while start + window_chars < len(text):
+        limit = start + window_chars
+        i = bisect.bisect_right(starts, limit) - 1
+        end = starts[i] if starts[i] > start else _hard_break(text, start, limit)
+        windows.append((start, end))
+        # The next window begins at the first sentence inside the overlap, or right at the
+        # cut when no sentence starts there
+        j = bisect.bisect_left(starts, end - overlap_chars)
+        while j < len(starts) and starts[j] <= start:
+            j += 1
+        start = starts[j] if j < len(starts) and starts[j] <= end else end
+    windows.append((start, len(text)))
+    return windows
+
+
+# Character range each window is responsible for: overlaps are split at their midpoint, so an
+# entity found in two neighbouring windows is kept from exactly one of them
+def _core_ranges(windows, length):
+    cores = []
+    for k, (start, end) in enumerate(windows):
+        core_start = 0 if k == 0 else (start + windows[k - 1][1]) // 2
+        core_end = length if k == len(windows) - 1 else (windows[k + 1][0] + end) // 2
+        cores.append((core_start, core_end))
+    return cores
+
+
+# NER for documents too long to process as one spaCy doc (hundreds of KB, or beyond
+# nlp.max_length). Windows of every document go through one nlp.pipe call, optionally spread
+# over `n_process` worker processes; docs are consumed as they come out, so memory is bounded
+# by the batch rather than by the document. Entity offsets refer to the original text.
+class LongDocumentAnalyzer:
+    def __init__(self, nlp, window_chars=10000, overlap_chars=1000, batch_size=8, n_process=1):
+        self.nlp = nlp
+        self.window_chars = min(window_chars, getattr(nlp, 'max_length', window_chars))
+        self.overlap_chars = min(overlap_chars, self.window_chars // 2)
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.documents = 0
+        self.windows = 0
+
+    # Entities for every text, in order
+    def entities_many(self, texts, batch_size=None, n_process=None):
+        plans = []
+        for text in texts:
+            windows = split_windows(text, self.window_chars, self.overlap_chars)
+            plans.append((text, windows, _core_ranges(windows, len(text))))
+            self.documents += 1
+            self.windows += len(windows)
+
+        window_texts = (text[start:end] for text, windows, _ in plans for start, end in windows)
+        docs = self.nlp.pipe(window_texts, batch_size=batch_size or self.batch_size,
+                             n_process=n_process or self.n_process)
+
+        results = []
+        for text, windows, cores in plans:
+            seen = set()
+            entities = []
+            for (start, _), (core_start, core_end), doc in zip(windows, cores, docs):
+                for ent in doc.ents:
+                    ent_start, ent_end = start + ent.start_char, start + ent.end_char
+                    key = (ent_start, ent_end, ent.label_)
+                    if not core_start <= ent_start < core_end or key in seen:
+                        continue
+                    seen.add(key)
+                    entities.append(Entity(text[ent_start:ent_end], ent.label_, ent_start, ent_end))
+            results.append(entities)
+        return results
+
+    def entities(self, text, n_process=None):
+        return self.entities_many([text], n_process=n_process)[0]
+
+    def stats(self):
+        return {"documents": self.documents, "windows": self.windows}
@@ -0,0 +1,134 @@
+import ctypes
+import gc
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Current resident set size in MB (falls back to the peak where /proc is not available)
+def rss_mb():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+# Memory this process does not share with the master (the model pages forked copy-on-write
+# are shared); None where smaps_rollup is not available
+def private_mb():
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None
+    return sum(int(fields.get(name, '0 kB').split()[0]) for name in ('Private_Clean', 'Private_Dirty')) / 1024
+
+
+def process_memory():
+    stats = {"rss_mb": round(rss_mb(), 1), "peak_rss_mb": round(peak_rss_mb(), 1)}
+    private = private_mb()
+    if private is not None:
+        stats["private_mb"] = round(private, 1)
+    return stats
+
+
+# Hand freed heap pages back to the OS (glibc only; a no-op elsewhere)
+def _malloc_trim():
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+# Keeps a long-running serving process from growing without bound.
+#  - Optionally (IPSEE_MEMORY_ZONES=1) every NER call runs inside nlp.memory_zone()
+#    (spaCy >= 3.8), so the strings and lexemes of the text are dropped afterwards and the
+#    StringStore stays at its loaded size. Zones must not overlap, so this serializes all
+#    model calls of a worker and costs throughput with gthread workers; it is off by default
+#    and string growth is then bounded by recycling (max_string_growth) instead.
+#  - Above `soft_rss_mb` the garbage collector runs and freed memory is returned to the OS,
+#    at most once per `trim_interval` seconds.
+#  - Above `hard_rss_mb`, or once more than `max_string_growth` strings were added (models
+#    or spaCy versions without memory zones), check() returns a reason to recycle the
+#    worker. The gunicorn post_request hook then lets it drain and the master forks a
+#    fresh one from the pristine preloaded model.
+class MemoryGuard:
+    def __init__(self, nlp, soft_rss_mb=0, hard_rss_mb=0, max_string_growth=0, memory_zones=False,
+                 trim_interval=60):
+        self.nlp = nlp
+        vocab = getattr(nlp, 'vocab', None)
+        self.strings = vocab.strings if vocab is not None else None
+        self.baseline_strings = len(self.strings) if self.strings is not None else 0
+        self.soft_rss_mb = soft_rss_mb
+        self.hard_rss_mb = hard_rss_mb
+        self.max_string_growth = max_string_growth
+        self.use_zones = memory_zones and hasattr(nlp, 'memory_zone')
+        self.trim_interval = trim_interval
+        self.trims = 0
+        self.zones = 0
+        self.recycle_reason = None
+        self._last_trim = 0.0
+        self._zone_lock = threading.Lock()
+
+    # Wrap model calls whose results are fully converted to plain Python objects inside the
+    # block; spans and docs created in a zone are invalid after it
+    @contextmanager
+    def zone(self):
+        if not self.use_zones:
+            yield
+            return
+        with self._zone_lock, self.nlp.memory_zone():
+            self.zones += 1
+            yield
+
+    def string_growth(self):
+        return len(self.strings) - self.baseline_strings if self.strings is not None else 0
+
+    # Called after every request. Returns why the worker should be recycled, or None.
+    def check(self):
+        if self.recycle_reason is not None:
+            return self.recycle_reason
+        rss = rss_mb()
+        if self.hard_rss_mb and rss > self.hard_rss_mb:
+            self.recycle_reason = f"RSS {rss:.0f}MB above {self.hard_rss_mb}MB"
+        elif self.max_string_growth and self.string_growth() > self.max_string_growth:
+            self.recycle_reason = f"{self.string_growth()} strings added to the vocab since start"
+        elif self.soft_rss_mb and rss > self.soft_rss_mb and time.monotonic() - self._last_trim > self.trim_interval:
+            self._last_trim = time.monotonic()
+            gc.collect()
+            _malloc_trim()
+            self.trims += 1
+        return self.recycle_reason
+
+    def stats(self):
+        return {
+            **process_memory(),
+            "soft_rss_mb": self.soft_rss_mb,
+            "hard_rss_mb": self.hard_rss_mb,
+            "strings": len(self.strings) if self.strings is not None else None,
+            "string_growth": self.string_growth(),
+            "memory_zones": self.use_zones,
+            "zones": self.zones,
+            "trims": self.trims,
+            "recycle_reason": self.recycle_reason,
+        }
+
+
+# Guard configured from IPSEE_RSS_SOFT_MB / IPSEE_RSS_HARD_MB / IPSEE_MAX_STRING_GROWTH /
+# IPSEE_MEMORY_ZONES (0 turns a limit off)
+def memory_guard_from_env(nlp):
+    return MemoryGuard(
+        nlp,
+        soft_rss_mb=float(os.environ.get('IPSEE_RSS_SOFT_MB', 0)),
+        hard_rss_mb=float(os.environ.get('IPSEE_RSS_HARD_MB', 0)),
+        max_string_growth=int(os.environ.get('IPSEE_MAX_STRING_GROWTH', 500000)),
+        memory_zones=os.environ.get('IPSEE_MEMORY_ZONES', '0') == '1',
+        trim_interval=float(os.environ.get('IPSEE_TRIM_INTERVAL', 60)),
+    )
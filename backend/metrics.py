@@ -0,0 +1,423 @@
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Default latency buckets in seconds (upper bounds; +Inf is implicit)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Input length buckets in characters
+LENGTH_BUCKETS = (100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+# Monotonic counter, optionally split by label values
+class MetricCounter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    # JSON-serialisable copy of the values, for the multiprocess files
+    def export(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    # Values of several processes (pid, export) added up
+    def merge(self, exports):
+        values = Counter()
+        for _, export in exports:
+            for key, value in export:
+                values[tuple(key)] += value
+        return self.labels, values
+
+    def samples(self, merged=None):
+        if merged is None:
+            with self._lock:
+                merged = self.labels, dict(self._values)
+        labels, values = merged
+        return [(self.name, _label_text(labels, key), value) for key, value in sorted(values.items())]
+
+
+# Value set from the outside (e.g. cache sizes copied in when /metrics is scraped). Gauges
+# describe one process, so across processes they are kept apart by a pid label.
+class Gauge(MetricCounter):
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def merge(self, exports):
+        if "pid" in self.labels:
+            values = {tuple(key): value for _, export in exports for key, value in export}
+            return self.labels, values
+        values = {tuple(key) + (pid,): value for pid, export in exports for key, value in export}
+        return self.labels + ("pid",), values
+
+
+# Cumulative histogram with fixed buckets, optionally split by label values
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            series["counts"][index] += 1
+            series["sum"] += value
+
+    def export(self):
+        with self._lock:
+            return [[list(key), list(value["counts"]), value["sum"]] for key, value in self._series.items()]
+
+    def merge(self, exports):
+        series = {}
+        for _, export in exports:
+            for key, counts, total in export:
+                merged = series.setdefault(tuple(key), ([0] * len(counts), [0.0]))
+                for i, count in enumerate(counts):
+                    merged[0][i] += count
+                merged[1][0] += total
+        return self.labels, {key: (counts, total[0]) for key, (counts, total) in series.items()}
+
+    def samples(self, merged=None):
+        if merged is None:
+            with self._lock:
+                merged = self.labels, {key: (list(value["counts"]), value["sum"]) for key, value in self._series.items()}
+        _, series = merged
+        lines = []
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += count
+                lines.append((f"{self.name}_bucket", _label_text(self.labels + ("le",), key + (bound,)), cumulative))
+            lines.append((f"{self.name}_sum", _label_text(self.labels, key), total))
+            lines.append((f"{self.name}_count", _label_text(self.labels, key), cumulative))
+        return lines
+
+
+# Metrics of all worker processes on the host, shared through a directory. Every process
+# writes its own values to `{pid}.json` from a background thread every `interval` seconds
+# (and on exit); the process answering a scrape adds the files up, so counters and
+# histograms neither jump between workers nor look like resets. Files of exited workers are
+# folded into archived.json, which keeps their counts and the directory small. Gauges of
+# exited workers are dropped.
+class MultiprocessStore:
+    def __init__(self, registry, directory, interval=1.0):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    # Started lazily and restarted after a fork, like the profiler's sampler
+    def ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name="metrics-writer", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.write()
+
+    def write(self):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.registry.export(), f)
+        os.replace(path + ".tmp", path)
+
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # {metric name: [(pid, export), ...]} over this process (live values) and all files
+    def collect(self):
+        with open(os.path.join(self.directory, ".lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            archived = self._read(os.path.join(self.directory, "archived.json"))
+            live = {}
+            dead = []
+            for name in os.listdir(self.directory):
+                pid = name[:-len(".json")]
+                if not name.endswith(".json") or not pid.isdigit() or int(pid) == os.getpid():
+                    continue
+                if _alive(int(pid)):
+                    live[pid] = self._read(os.path.join(self.directory, name))
+                else:
+                    dead.append((pid, self._read(os.path.join(self.directory, name))))
+            if dead:
+                archived = self._archive(archived, dead)
+            live[str(os.getpid())] = self.registry.export()
+
+        exports = {}
+        for pid, values in [("archived", archived)] + sorted(live.items()):
+            for metric in self.registry.metrics:
+                if metric.name in values and not (pid == "archived" and metric.kind == "gauge"):
+                    exports.setdefault(metric.name, []).append((pid, values[metric.name]))
+        return exports
+
+    # Add the counters and histograms of exited workers to archived.json and remove their files
+    def _archive(self, archived, dead):
+        merged = {}
+        for metric in self.registry.metrics:
+            if metric.kind == "gauge":
+                continue
+            exports = [(pid, values[metric.name]) for pid, values in [("archived", archived)] + dead
+                       if metric.name in values]
+            if not exports:
+                continue
+            _, values = metric.merge(exports)
+            if metric.kind == "histogram":
+                merged[metric.name] = [[list(key), counts, total] for key, (counts, total) in values.items()]
+            else:
+                merged[metric.name] = [[list(key), value] for key, value in values.items()]
+        path = os.path.join(self.directory, "archived.json")
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(merged, f)
+        os.replace(path + ".tmp", path)
+        for pid, _ in dead:
+            try:
+                os.remove(os.path.join(self.directory, f"{pid}.json"))
+            except OSError:
+                pass
+        return merged
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Metrics rendered in the Prometheus text exposition format. Without a shared directory
+# (IPSEE_METRICS_DIR) they describe this process only; under gunicorn, gunicorn.conf.py sets
+# one up so a scrape reports all workers together.
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collect_hooks = []
+        self.multiprocess = None
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    # Functions that refresh gauges (cache sizes, memory) before values are read or written
+    def on_collect(self, hook):
+        self.collect_hooks.append(hook)
+        return hook
+
+    def _run_hooks(self):
+        for hook in self.collect_hooks:
+            hook()
+
+    def export(self):
+        self._run_hooks()
+        return {metric.name: metric.export() for metric in self.metrics}
+
+    def render(self):
+        if self.multiprocess is not None:
+            self.multiprocess.ensure_writer()
+            exports = self.multiprocess.collect()
+        else:
+            self._run_hooks()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if self.multiprocess is not None:
+                samples = metric.samples(metric.merge(exports.get(metric.name, [])))
+            else:
+                samples = metric.samples()
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Called on every request so the writer thread runs in every worker, and on worker exit
+    def ensure_writer(self):
+        if self.multiprocess is not None:
+            self.multiprocess.ensure_writer()
+
+    def flush(self):
+        if self.multiprocess is not None:
+            self.multiprocess.write()
+
+
+REGISTRY = Registry()
+if os.environ.get('IPSEE_METRICS_DIR'):
+    REGISTRY.multiprocess = MultiprocessStore(REGISTRY, os.environ['IPSEE_METRICS_DIR'],
+                                              interval=float(os.environ.get('IPSEE_METRICS_INTERVAL', 1)))
+
+REQUESTS = REGISTRY.register(MetricCounter(
+    "ipsee_requests_total", "Requests by endpoint and HTTP status", labels=("endpoint", "status")))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "ipsee_request_seconds", "End-to-end request latency", LATENCY_BUCKETS, labels=("endpoint",)))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "ipsee_stage_seconds", "Time spent in each stage of the request path", LATENCY_BUCKETS, labels=("stage",)))
+INPUT_LENGTH = REGISTRY.register(Histogram(
+    "ipsee_input_chars", "Length of the analysed TOS texts in characters", LENGTH_BUCKETS))
+ENTITIES = REGISTRY.register(MetricCounter(
+    "ipsee_entities_total", "Recognised entities by label", labels=("label",)))
+CACHE = REGISTRY.register(Gauge(
+    "ipsee_cache", "Result cache counters of each worker process (copied from its /cache/stats; by pid under gunicorn)",
+    labels=("tier", "stat")))
+CASCADE = REGISTRY.register(MetricCounter(
+    "ipsee_cascade_total", "Documents by the cascade tier that decided them (rules or ner)", labels=("tier",)))
+VERDICT_LOOKUPS = REGISTRY.register(MetricCounter(
+    "ipsee_verdict_lookups_total", "Hash-first /analyze/lookup requests by outcome (hit or miss)", labels=("outcome",)))
+MEMORY = REGISTRY.register(Gauge(
+    "ipsee_memory", "Memory of each worker process (MB, string counts; by pid under gunicorn)", labels=("stat",)))
+PROCESS = REGISTRY.register(Gauge(
+    "ipsee_process_info", "Live worker processes whose metrics are included", labels=("pid",)))
+
+
+# Time a block and record it as one stage of the request path
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, name)
+
+
+def count_entities(ents):
+    for ent in ents:
+        ENTITIES.inc(ent.label_)
+
+
+# Sampling profiler for slow requests. While enabled, a background thread records the stack
+# of every in-flight request thread each `interval_ms`; when a request ends after more than
+# `threshold_ms`, its samples are written to `output_dir` in the collapsed-stack format read
+# by flamegraph.pl and speedscope. Requests under the threshold cost one dict update.
+class SlowRequestProfiler:
+    def __init__(self, threshold_ms, output_dir, interval_ms=5, max_profiles=100):
+        self.threshold = threshold_ms / 1000
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000
+        self.max_profiles = max_profiles
+        self.written = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    # Started lazily and restarted after a fork, like the micro-batching worker
+    def _ensure_sampler(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._active = {}
+            threading.Thread(target=self._sample, name="slow-request-profiler", daemon=True).start()
+            self._pid = os.getpid()
+
+    # Counts are only added under the lock and only for requests still in _active, so a
+    # request's counter no longer changes once profile() has removed it
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is None:
+                        continue
+                    names = []
+                    while frame is not None:
+                        code = frame.f_code
+                        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stacks[";".join(reversed(names))] += 1
+
+    @contextmanager
+    def profile(self, name):
+        self._ensure_sampler()
+        thread_id = threading.get_ident()
+        stacks = Counter()
+        with self._lock:
+            self._active[thread_id] = stacks
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._active.pop(thread_id, None)
+                stacks = Counter(stacks)
+            if elapsed >= self.threshold and stacks and self.written < self.max_profiles:
+                # Profiling must never fail the request it observed
+                try:
+                    self._dump(name, elapsed, stacks)
+                except OSError:
+                    pass
+
+    def _dump(self, name, elapsed, stacks):
+        self.written += 1
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{name}-{int(time.time() * 1000)}-{os.getpid()}-{int(elapsed * 1000)}ms.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# Profiler configured from the environment, or None when IPSEE_PROFILE_SLOW_MS is unset
+def profiler_from_env():
+    threshold_ms = os.environ.get('IPSEE_PROFILE_SLOW_MS')
+    if not threshold_ms:
+        return None
+    return SlowRequestProfiler(
+        threshold_ms=float(threshold_ms),
+        output_dir=os.environ.get('IPSEE_PROFILE_DIR', './slow_profiles'),
+        interval_ms=float(os.environ.get('IPSEE_PROFILE_INTERVAL_MS', 5)),
+        max_profiles=int(os.environ.get('IPSEE_PROFILE_MAX', 100)),
+    )
@@ -1,19 +1,192 @@
-@app.route('/analyze', methods=['POST'])
-def analyze_tos():
-    data = request.get_json()
-    tos_text = data.get('tos_text', '')
-    options = data.get('options', '')
+import functools
+import os
+import threading
+import time
+from contextlib import nullcontext
+from flask import Flask, request, jsonify
+from werkzeug.exceptions import HTTPException
 
-    if not tos_text.strip():
-        return jsonify({"error": "tos_text is required"}), 400
+from result_cache import LRUCache, cache_from_env
+from verdict_store import tos_sha256, verdict_store_from_env
+from incremental_ner import Entity, IncrementalAnalyzer
+from long_document import LongDocumentAnalyzer
+from batch_scheduler import MicroBatcher
+from memory_guard import memory_guard_from_env, process_memory
+import rulebased_logic
+import metrics
+from metrics import stage
+
+app = Flask(__name__)
+
+# Fine-tuned NER model. Only doc.ents is used, so by default the tagger, parser,
+# attribute_ruler and lemmatizer are not loaded at all (IPSEE_SERVING_MODE=full keeps them).
+MODEL_PATH = os.environ.get('IPSEE_MODEL_PATH', './ipsee_ner_model')
+SERVING_MODE = os.environ.get('IPSEE_SERVING_MODE', 'ner')
+
+# Defaults for nlp.pipe in the batch endpoint
+BATCH_SIZE = int(os.environ.get('IPSEE_BATCH_SIZE', 64))
+N_PROCESS = int(os.environ.get('IPSEE_N_PROCESS', 1))
+
+# Limits on what a client may ask of /analyze/batch. The process count is server-side only:
+# every gunicorn worker would otherwise fork as many model processes as a request asks for.
+MAX_BATCH_SIZE = int(os.environ.get('IPSEE_BATCH_SIZE_LIMIT', 256))
+MAX_BATCH_ITEMS = int(os.environ.get('IPSEE_BATCH_ITEMS_LIMIT', 1000))
+MAX_BATCH_ITEM_CHARS = int(os.environ.get('IPSEE_BATCH_ITEM_CHARS_LIMIT', 200000))
+MAX_BATCH_TOTAL_CHARS = int(os.environ.get('IPSEE_BATCH_TOTAL_CHARS_LIMIT', 2000000))
+
+# Incremental mode: NER runs only on paragraphs/sentences not seen before (IPSEE_INCREMENTAL=1)
+INCREMENTAL = os.environ.get('IPSEE_INCREMENTAL', '0') == '1'
+
+# Long-document mode: texts over IPSEE_LONG_DOC_CHARS characters (0 disables) are split into
+# overlapping sentence windows of IPSEE_LONG_DOC_WINDOW characters, which run through
+# nlp.pipe on IPSEE_LONG_DOC_PROCESSES processes. Not used in incremental mode, whose units
+# are already short.
+LONG_DOC_CHARS = int(os.environ.get('IPSEE_LONG_DOC_CHARS', 50000))
+
+# Cascade mode: the keyword rules of rulebased_logic answer clear-cut documents and the NER
+# runs only when they are inconclusive (IPSEE_CASCADE=1)
+CASCADE = os.environ.get('IPSEE_CASCADE', '0') == '1'
+
+# Canned TOS run through the model once after loading, so the first real request does not
+# pay for lazy allocations inside spaCy/thinc
+WARMUP_TOS = """
+This website uses cookies to enhance user experience. By continuing to browse, we assume your consent.
+We collect personal data for marketing purposes and share your data with third-party partners.
+Essential cookies are required for core functionality. You can accept all cookies or reject all cookies.
+"""
+
+# Everything below is created by init_service(), not at import time
+nlp = None
+result_cache = None
+incremental = None
+long_documents = None
+verdict_store = None
+memory_guard = None
+_ready = threading.Event()
+_init_lock = threading.Lock()
+
+
+# Load the model, build the caches and warm up. Safe to call more than once; the preforking
+# server calls it in the master process before forking (see gunicorn.conf.py).
+def init_service():
+    global nlp, result_cache, incremental, long_documents, verdict_store, memory_guard
+    with _init_lock:
+        if _ready.is_set():
+            return
+        import spacy
+        from serving_model import load_serving_model
+
+        nlp = spacy.load(MODEL_PATH) if SERVING_MODE == 'full' else load_serving_model(MODEL_PATH)
+
+        # Results are keyed by the model too, so a retrained model never serves stale verdicts
+        model_namespace = f"{MODEL_PATH}:{nlp.meta.get('version', '')}"
+        # Bumped when the rules tier changes the results it stores
+        result_cache = cache_from_env(namespace=f"{model_namespace}:cascade2" if CASCADE else model_namespace)
+        incremental = IncrementalAnalyzer(
+            nlp,
+            cache=LRUCache(maxsize=int(os.environ.get('IPSEE_UNIT_CACHE_SIZE', 100000)),
+                           ttl=float(os.environ.get('IPSEE_UNIT_CACHE_TTL', 7 * 24 * 3600))),
+            namespace=model_namespace,
+            batch_size=BATCH_SIZE,
+        ) if INCREMENTAL else None
+        long_documents = LongDocumentAnalyzer(
+            nlp,
+            window_chars=int(os.environ.get('IPSEE_LONG_DOC_WINDOW', 10000)),
+            overlap_chars=int(os.environ.get('IPSEE_LONG_DOC_OVERLAP', 1000)),
+            n_process=int(os.environ.get('IPSEE_LONG_DOC_PROCESSES', 1)),
+        ) if LONG_DOC_CHARS > 0 and not INCREMENTAL else None
+        # Hash-first protocol: verdicts by TOS hash for /analyze/lookup (IPSEE_VERDICT_DB=path)
+        verdict_store = verdict_store_from_env()
+
+        warm_up()
+        # Created after the warm-up so its strings count as part of the loaded model
+        memory_guard = memory_guard_from_env(nlp)
+        _ready.set()
+
+
+# Exercise both the single-document and the nlp.pipe path directly on the model. This
+# bypasses the caches and the micro-batching thread so nothing is started before a fork.
+def warm_up():
+    build_result(nlp(WARMUP_TOS).ents, "Accept All")
+    for doc in nlp.pipe([WARMUP_TOS, WARMUP_TOS.upper()], batch_size=BATCH_SIZE):
+        build_result(doc.ents, "Accept All")
+
+
+def is_ready():
+    return _ready.is_set()
 
-    doc = nlp(tos_text)
+
+# StringStore growth guard: model calls run in a memory zone when the model supports it
+def model_zone():
+    return memory_guard.zone() if memory_guard is not None else nullcontext()
+
+
+# Spans do not outlive their memory zone, so results leave it as plain tuples
+def plain_entities(ents):
+    return [Entity(ent.text, ent.label_, ent.start_char, ent.end_char) for ent in ents]
+
+
+# Reason to recycle this worker, if its memory guard has tripped (see gunicorn.conf.py)
+def memory_check():
+    return memory_guard.check() if memory_guard is not None else None
+
+
+# nlp.max_length is the character limit of one doc (spaCy's, or OnnxNerModel's equivalent)
+def is_long(text):
+    return long_documents is not None and len(text) > min(LONG_DOC_CHARS, getattr(nlp, 'max_length', LONG_DOC_CHARS))
+
+
+# Entities for many documents, either from one nlp.pipe pass or from the unit cache. When a
+# long document is among them, all of them go through the windowed pipe instead.
+def extract_entities_many(texts, batch_size=BATCH_SIZE, n_process=N_PROCESS):
+    with model_zone():
+        if incremental is not None:
+            return incremental.entities_many(texts)
+        if any(is_long(text) for text in texts):
+            return long_documents.entities_many(texts, batch_size=batch_size, n_process=n_process)
+        return [plain_entities(doc.ents) for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
+
+
+# Micro-batching: concurrent /analyze requests are queued and run through the model together
+# (IPSEE_MICROBATCH=1). A batch is flushed at IPSEE_MAX_BATCH_SIZE documents or after
+# IPSEE_MAX_WAIT_MS milliseconds, whichever comes first.
+MICROBATCH = os.environ.get('IPSEE_MICROBATCH', '0') == '1'
+scheduler = MicroBatcher(
+    extract_entities_many,
+    max_batch_size=int(os.environ.get('IPSEE_MAX_BATCH_SIZE', 32)),
+    max_wait_ms=float(os.environ.get('IPSEE_MAX_WAIT_MS', 5)),
+) if MICROBATCH else None
+
+
+# Entities for one document. On the direct path tokenization and the pipeline components
+# are timed separately; the long-document, queued and incremental paths are timed as a whole.
+def extract_entities(tos_text):
+    if is_long(tos_text):
+        with stage("ner_long"), model_zone():
+            return long_documents.entities(tos_text)
+    if scheduler is not None:
+        with stage("ner_batched"):
+            return scheduler.submit(tos_text)
+    if incremental is not None:
+        with stage("ner_incremental"), model_zone():
+            return incremental.entities(tos_text)
+    with model_zone():
+        with stage("tokenize"):
+            doc = nlp.make_doc(tos_text)
+        with stage("ner"):
+            for _, component in nlp.pipeline:
+                doc = component(doc)
+        return plain_entities(doc.ents)
+
+
+# Turn the recognised entities into the response returned to the Node backend
+def build_result(ents, options):
     violations = []
     essentialCookiesRequired = False
     misleading_option_detected = False
 
     # Log detected entities for debugging
-    for ent in doc.ents:
+    for ent in ents:
         if ent.label_ == "VIOLATION":
             violations.append(ent.text)
         if ent.label_ == "ESSENTIAL_COOKIE":
@@ -25,14 +198,320 @@ def analyze_tos():
 
     # Ensure the essential cookies flag is checked and handled
     cookieOptions = "Accept Essential Cookies" if essentialCookiesRequired else (
-        "Reject All Cookies" if misleading_option_detected or ("Accept All" in options and violations) else 
+        "Reject All Cookies" if misleading_option_detected or ("Accept All" in options and violations) else
         "Accept All Cookies" if compliant else "Reject All Cookies"
     )
 
-    return jsonify({
+    return {
         "compliant": compliant,
         "violations": violations,
         "essentialCookiesRequired": essentialCookiesRequired,  # Ensure this is returned
         "cookieOptions": cookieOptions,
         "misleadingOptionDetected": misleading_option_detected
-    }), 200
+    }
+
+
+# Rule findings that settle a document on their own, even when the TOS also mentions consent
+# or user rights
+DECISIVE_CATEGORIES = ("implicit_consent", "deceptive_practices")
+
+# NER labels of the keyword categories, so rule matches become entities for build_result
+RULE_LABELS = {
+    "implicit_consent": ("VIOLATION",),
+    "broad_data_collection": ("VIOLATION",),
+    "third_party_sharing": ("VIOLATION",),
+    "outdated_tos": ("VIOLATION",),
+    "deceptive_practices": ("VIOLATION", "MISLEADING_OPTION"),
+    "essential_cookies": ("ESSENTIAL_COOKIE",),
+}
+
+
+# First tier of the cascade: the rule-based verdict in the /analyze response format, or None
+# when the rules fall back to "Further investigation required" or contradict themselves.
+# A compliant verdict (both accept-all and reject-all, or essential-only) counts only when no
+# violation phrase was found; a non-compliant one needs a decisive finding such as an
+# implicit-consent phrase or an accept-all option without reject-all. The matched phrases go
+# through build_result as entities, so the response has the same shape as the NER tier's
+# (violations are spans of the text) and must reach the same compliance verdict.
+def rules_result(tos_text, options):
+    if not CASCADE:
+        return None
+    with stage("rules"):
+        cookie_options = [options] if isinstance(options, str) else list(options or [])
+        verdict, findings = rulebased_logic.apply_rules(tos_text, cookie_options, verbose=False)
+    if verdict["decision"] == rulebased_logic.FALLBACK_DECISION:
+        return None
+
+    accept_without_reject = findings["accept_all"] and not findings["reject_all"]
+    if verdict["compliance"]:
+        if findings["violations"]:
+            return None
+    elif not accept_without_reject and not any(category in findings["categories"] for category in DECISIVE_CATEGORIES):
+        return None
+
+    ents = [Entity(tos_text[start:end], label, start, end)
+            for start, end, category, _ in findings["matches"] for label in RULE_LABELS.get(category, ())]
+    result = build_result(ents, options)
+    if result["compliant"] != verdict["compliance"]:
+        return None
+    return decided_by(result, "rules")
+
+
+# Record the cascade tier that answered, in the response and in the metrics
+def decided_by(result, tier):
+    if CASCADE:
+        result["decidedBy"] = tier
+        metrics.CASCADE.inc(tier)
+    return result
+
+
+# Keep the verdict so a later /analyze/lookup with the text's hash is answered without the text
+def remember_verdict(tos_text, options, url, result):
+    if verdict_store is not None:
+        verdict_store.record(tos_sha256(tos_text), options, result_cache.namespace, url or '', result)
+
+
+# Dumps a sampled profile of requests slower than IPSEE_PROFILE_SLOW_MS (off when unset)
+profiler = metrics.profiler_from_env()
+
+
+# Request count, status and latency per endpoint, profiled when the profiler is enabled
+def instrumented(endpoint):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            metrics.REGISTRY.ensure_writer()
+            start = time.perf_counter()
+            # An exception escaping the view is still counted: Flask turns it into a 500, or
+            # into the status of an HTTPException (e.g. a 400 for a malformed JSON body)
+            status = 500
+            try:
+                with profiler.profile(endpoint) if profiler is not None else nullcontext():
+                    response = view(*args, **kwargs)
+                status = response[1] if isinstance(response, tuple) else getattr(response, 'status_code', 200)
+                return response
+            except HTTPException as error:
+                status = error.code
+                raise
+            finally:
+                metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint)
+                metrics.REQUESTS.inc(endpoint, status)
+        return wrapper
+    return decorator
+
+
+# Returned instead of a stalled request while the model is still loading
+def not_ready_response():
+    return jsonify({"error": "model is loading"}), 503, {"Retry-After": "1"}
+
+
+@app.route('/analyze', methods=['POST'])
+@instrumented('analyze')
+def analyze_tos():
+    if not is_ready():
+        return not_ready_response()
+
+    with stage("parse"):
+        data = request.get_json()
+    tos_text = data.get('tos_text', '')
+    options = data.get('options', '')
+    url = data.get('url', '')
+
+    if not tos_text.strip():
+        return jsonify({"error": "tos_text is required"}), 400
+    metrics.INPUT_LENGTH.observe(len(tos_text))
+
+    # Identical banners from popular sites are answered from the cache without an NER pass
+    with stage("cache_lookup"):
+        cache_key = result_cache.key(tos_text, options)
+        result = result_cache.get(cache_key)
+    if result is None:
+        result = rules_result(tos_text, options)
+        if result is None:
+            ents = extract_entities(tos_text)
+            metrics.count_entities(ents)
+            with stage("build"):
+                result = decided_by(build_result(ents, options), "ner")
+        result_cache.set(cache_key, result)
+        remember_verdict(tos_text, options, url, result)
+
+    with stage("serialize"):
+        # The hash tells the client what to send to /analyze/lookup next time
+        response = jsonify({**result, "tosSha256": tos_sha256(tos_text)} if verdict_store is not None else result)
+    return response, 200
+
+
+# First step of the hash-first protocol: {url, tos_sha256, options} instead of the full text.
+# A known hash returns the stored verdict; on a miss the client uploads the text to /analyze.
+@app.route('/analyze/lookup', methods=['POST'])
+@instrumented('analyze_lookup')
+def analyze_lookup():
+    if not is_ready():
+        return not_ready_response()
+
+    data = request.get_json()
+    sha256 = str(data.get('tos_sha256', '')).lower() if isinstance(data, dict) else ''
+    if len(sha256) != 64 or any(char not in '0123456789abcdef' for char in sha256):
+        return jsonify({"error": "tos_sha256 must be a hex SHA-256 digest"}), 400
+
+    result = None
+    if verdict_store is not None:
+        with stage("verdict_lookup"):
+            result = verdict_store.lookup(sha256, data.get('options', ''), result_cache.namespace, data.get('url', ''))
+    metrics.VERDICT_LOOKUPS.inc("hit" if result is not None else "miss")
+    if result is None:
+        return jsonify({"known": False}), 200
+    return jsonify({"known": True, "result": result}), 200
+
+
+# Analyze many documents in one call. Cached documents are answered directly and the
+# remaining unique texts go through nlp.pipe together; results keep the input order.
+def analyze_batch(items, batch_size=BATCH_SIZE, n_process=N_PROCESS):
+    results = [None] * len(items)
+    pending = {}
+    for i, item in enumerate(items):
+        tos_text = item.get('tos_text', '') if isinstance(item, dict) else ''
+        options = item.get('options', '') if isinstance(item, dict) else ''
+        if not isinstance(tos_text, str) or not tos_text.strip():
+            results[i] = {"error": "tos_text is required"}
+            continue
+        metrics.INPUT_LENGTH.observe(len(tos_text))
+        cache_key = result_cache.key(tos_text, options)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            results[i] = cached
+            continue
+        ruled = rules_result(tos_text, options)
+        if ruled is not None:
+            result_cache.set(cache_key, ruled)
+            remember_verdict(tos_text, options, item.get('url', ''), ruled)
+            results[i] = ruled
+            continue
+        # Identical documents within one batch share a single NER pass
+        pending.setdefault(cache_key, (tos_text, options, []))[2].append(i)
+
+    keys = list(pending)
+    texts = [pending[key][0] for key in keys]
+    with stage("ner_batch"):
+        entity_lists = extract_entities_many(texts, batch_size=batch_size, n_process=n_process)
+    for key, ents in zip(keys, entity_lists):
+        _, options, indices = pending[key]
+        metrics.count_entities(ents)
+        result = decided_by(build_result(ents, options), "ner")
+        result_cache.set(key, result)
+        remember_verdict(pending[key][0], options, items[indices[0]].get('url', ''), result)
+        for i in indices:
+            results[i] = result
+
+    return results
+
+
+@app.route('/analyze/batch', methods=['POST'])
+@instrumented('analyze_batch')
+def analyze_tos_batch():
+    if not is_ready():
+        return not_ready_response()
+
+    with stage("parse"):
+        data = request.get_json()
+    # A bare JSON list is accepted as shorthand for {"items": [...]}
+    if isinstance(data, list):
+        data = {"items": data}
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return jsonify({"error": "items must be a list of {tos_text, options}"}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"at most {MAX_BATCH_ITEMS} items per batch"}), 400
+    lengths = [len(item.get('tos_text')) for item in items
+               if isinstance(item, dict) and isinstance(item.get('tos_text'), str)]
+    if lengths and max(lengths) > MAX_BATCH_ITEM_CHARS:
+        return jsonify({"error": f"tos_text is limited to {MAX_BATCH_ITEM_CHARS} characters per item"}), 413
+    if sum(lengths) > MAX_BATCH_TOTAL_CHARS:
+        return jsonify({"error": f"at most {MAX_BATCH_TOTAL_CHARS} characters of tos_text per batch"}), 413
+
+    batch_size = data.get('batch_size', BATCH_SIZE)
+    if isinstance(batch_size, bool) or not isinstance(batch_size, int) or batch_size < 1:
+        return jsonify({"error": "batch_size must be a positive integer"}), 400
+
+    results = analyze_batch(items, batch_size=min(batch_size, MAX_BATCH_SIZE), n_process=N_PROCESS)
+    with stage("serialize"):
+        response = jsonify({"results": results})
+    return response, 200
+
+
+# Readiness probe: healthy only once the model is loaded and warmed up
+@app.route('/ready', methods=['GET'])
+def ready():
+    if not is_ready():
+        return jsonify({"ready": False}), 503
+    return jsonify({"ready": True}), 200
+
+
+# Liveness probe: the process is up, whether or not the model has finished loading. Also
+# reports this worker's memory and the state of its memory guard.
+@app.route('/health', methods=['GET'])
+def health():
+    memory = memory_guard.stats() if memory_guard is not None else process_memory()
+    return jsonify({"status": "ok", "ready": is_ready(), "pid": os.getpid(), "memory": memory}), 200
+
+
+# Cache counters for sizing IPSEE_CACHE_SIZE / IPSEE_CACHE_TTL
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    if not is_ready():
+        return not_ready_response()
+    stats = result_cache.stats()
+    if incremental is not None:
+        stats["units"] = incremental.stats()
+    if long_documents is not None:
+        stats["long_documents"] = long_documents.stats()
+    if verdict_store is not None:
+        stats["verdicts"] = verdict_store.stats()
+    return jsonify(stats), 200
+
+
+# Batch sizes actually achieved by the micro-batching scheduler
+@app.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    if scheduler is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **scheduler.stats()}), 200
+
+
+# Copy this worker's memory and cache counters into the gauges before metrics are read,
+# either for a scrape or for the multiprocess file
+@metrics.REGISTRY.on_collect
+def update_gauges():
+    metrics.PROCESS.set(1, os.getpid())
+    memory = memory_guard.stats() if memory_guard is not None else process_memory()
+    for name, value in memory.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics.MEMORY.set(value, name)
+    if is_ready():
+        stats = result_cache.stats()
+        for name in ("size", "hits", "misses", "evictions", "expirations"):
+            metrics.CACHE.set(stats[name], "local", name)
+        for name, value in stats.get("shared", {}).items():
+            if name != "path":
+                metrics.CACHE.set(value, "shared", name)
+        if incremental is not None:
+            for name, value in incremental.stats().items():
+                metrics.CACHE.set(value, "units", name)
+        if verdict_store is not None:
+            for name, value in verdict_store.stats().items():
+                if name != "path":
+                    metrics.CACHE.set(value, "verdicts", name)
+
+
+# Prometheus scrape endpoint: request/stage latency and input length histograms, entity
+# label counters, and per-worker cache and memory gauges. Under gunicorn the values of all
+# workers are combined (see metrics.MultiprocessStore).
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return metrics.REGISTRY.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+if __name__ == '__main__':
+    # Load in the background so /health and /ready answer while the model is loading
+    threading.Thread(target=init_service, name="init-service", daemon=True).start()
+    app.run(host='0.0.0.0', port=5000)
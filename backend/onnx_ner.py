@@ -0,0 +1,149 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from incremental_ner import Entity
+
+# meta.json "format" of a model directory exported by distill_student.py --transformer-student
+ONNX_FORMAT = "onnx"
+
+
+# What make_doc() returns: the text, with .ents filled in by the "ner" pipeline step
+class OnnxDoc:
+    def __init__(self, text):
+        self.text = text
+        self.ents = ()
+
+
+# A token-classification model exported to ONNX (int8-quantized when model.int8.onnx is
+# present), run with ONNX Runtime. It offers the parts of the spaCy Language API the service
+# uses: nlp(text), nlp.pipe(texts), nlp.make_doc + nlp.pipeline, and nlp.meta.
+# Texts longer than one window are split into windows that overlap by `stride` word pieces
+# (default: a quarter of a window, at most 32), and at most `max_batch_windows` windows go
+# through the model per run.
+class OnnxNerModel:
+    def __init__(self, model_path, intra_op_threads=None, stride=None, max_batch_windows=32):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = Path(model_path)
+        with open(model_path / "meta.json", 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.tags = self.meta["tags"]
+        # Word pieces per model window (meta.json "max_length" as written by distill_student.py)
+        self.max_pieces = self.meta.get("max_length", 512)
+        # Characters per document, like spaCy's nlp.max_length; longer texts are windowed by
+        # the service (long_document.py)
+        self.max_length = 1000000
+
+        self.tokenizer = Tokenizer.from_file(str(model_path / "tokenizer.json"))
+        self.tokenizer.no_padding()
+        # Each window repeats the last `stride` pieces of the previous one; the special tokens
+        # ([CLS], [SEP]) take part of the window
+        window = self.max_pieces - len(self.tokenizer.encode("").ids)
+        if stride is None:
+            stride = min(32, window // 4)
+        if not 0 <= stride < window:
+            raise ValueError(f"stride must be in [0, {window}) for windows of {self.max_pieces} pieces, got {stride}")
+        if max_batch_windows < 1:
+            raise ValueError(f"max_batch_windows must be positive, got {max_batch_windows}")
+        self.stride = stride
+        self.max_batch_windows = max_batch_windows
+        self.tokenizer.enable_truncation(self.max_pieces, stride=stride)
+
+        options = onnxruntime.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        onnx_file = model_path / "model.int8.onnx"
+        if not onnx_file.exists():
+            onnx_file = model_path / "model.onnx"
+        self.session = onnxruntime.InferenceSession(str(onnx_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.pipe_names = ["ner"]
+        self.component_names = ["ner"]
+        self.pipeline = [("ner", self._recognize)]
+
+    def make_doc(self, text):
+        return OnnxDoc(text)
+
+    def __call__(self, text):
+        return self._recognize(self.make_doc(text))
+
+    def pipe(self, texts, batch_size=64, n_process=1):
+        batch = []
+        for text in texts:
+            batch.append(self.make_doc(text))
+            if len(batch) >= batch_size:
+                yield from self._recognize_many(batch)
+                batch = []
+        if batch:
+            yield from self._recognize_many(batch)
+
+    def _recognize(self, doc):
+        return self._recognize_many([doc])[0]
+
+    # Tag ids per piece of each window, running at most `max_batch_windows` windows (padded to
+    # the longest of them) per call
+    def _predict(self, windows):
+        predictions = []
+        for first in range(0, len(windows), self.max_batch_windows):
+            chunk = windows[first:first + self.max_batch_windows]
+            width = max(len(window.ids) for window in chunk)
+            feeds = {
+                "input_ids": np.zeros((len(chunk), width), dtype=np.int64),
+                "attention_mask": np.zeros((len(chunk), width), dtype=np.int64),
+            }
+            for row, window in enumerate(chunk):
+                feeds["input_ids"][row, :len(window.ids)] = window.ids
+                feeds["attention_mask"][row, :len(window.ids)] = 1
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(feeds["input_ids"])
+            logits = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+            predictions.extend(logits.argmax(axis=-1))
+        return predictions
+
+    # Long texts are split into overlapping windows of `max_pieces` word pieces. The pieces two
+    # neighbouring windows share are split at their midpoint, so an entity is kept from the one
+    # window responsible for its first piece.
+    def _recognize_many(self, docs):
+        windows = []
+        for doc_index, doc in enumerate(docs):
+            encoding = self.tokenizer.encode(doc.text)
+            doc_windows = [encoding] + list(encoding.overflowing)
+            for k, window in enumerate(doc_windows):
+                skip_head = self.stride // 2 if k > 0 else 0
+                skip_tail = self.stride - self.stride // 2 if k < len(doc_windows) - 1 else 0
+                windows.append((doc_index, window, skip_head, skip_tail))
+        if not windows:
+            return docs
+
+        predictions = self._predict([window for _, window, _, _ in windows])
+        entities = [[] for _ in docs]
+        for (doc_index, window, skip_head, skip_tail), predicted in zip(windows, predictions):
+            entities[doc_index].extend(self._decode(docs[doc_index].text, window, predicted, skip_head, skip_tail))
+        for doc, doc_entities in zip(docs, entities):
+            doc.ents = tuple(doc_entities)
+        return docs
+
+    # Turn per-piece BIO tags into entities with character offsets, keeping those whose first
+    # piece is not among the first `skip_head` or last `skip_tail` content pieces
+    def _decode(self, text, window, predicted, skip_head=0, skip_tail=0):
+        content = len(window.special_tokens_mask) - sum(window.special_tokens_mask)
+        entities = []
+        current = None
+        position = -1
+        for (start, end), special, tag_id in zip(window.offsets, window.special_tokens_mask, predicted):
+            position += not special
+            tag = "O" if special else self.tags[tag_id]
+            if tag.startswith("I-") and current is not None and current[0] == tag[2:]:
+                current[2] = end
+                continue
+            if current is not None:
+                entities.append(current)
+            current = [tag[2:], start, end, position] if tag != "O" else None
+        if current is not None:
+            entities.append(current)
+        return [Entity(text[start:end], label, start, end) for label, start, end, first in entities
+                if skip_head <= first < content - skip_tail]
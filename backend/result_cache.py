@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Collapse whitespace the same way the extension does before it sends the TOS text
+def normalize_text(text):
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+# Options arrive either as a single string or as a list of button labels
+def normalize_options(options):
+    if isinstance(options, (list, tuple)):
+        return [normalize_text(str(option)) for option in options]
+    return normalize_text(str(options or ''))
+
+
+# Content-addressed key: SHA-256 over the normalized text, options and model namespace
+def make_cache_key(tos_text, options, namespace=''):
+    payload = json.dumps([namespace, normalize_text(tos_text), normalize_options(options)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Bounded in-process LRU cache where every entry also expires after `ttl` seconds
+class LRUCache:
+    def __init__(self, maxsize=4096, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Shared tier backed by a SQLite file so every worker on the host can read results
+# computed by any other worker. WAL mode lets readers proceed while one worker writes.
+# Expired rows are deleted when the tier is opened and after every `purge_every` writes.
+class SqliteCacheTier:
+    def __init__(self, path, ttl=3600, purge_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.writes = 0
+        self.purged = 0
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+        conn.commit()
+        self.purge_expired()
+
+    # One connection per thread and per process (connections must not cross a fork)
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._connect().execute(
+                "SELECT value FROM results WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl),
+            )
+            conn.commit()
+        except sqlite3.Error:
+            # The shared tier is best-effort; a locked or missing file must never fail a request
+            self.errors += 1
+            return
+        self.writes += 1
+        if self.purge_every and self.writes % self.purge_every == 0:
+            self.purge_expired()
+
+    # Drop expired rows so the file does not grow without bound
+    def purge_expired(self):
+        try:
+            conn = self._connect()
+            self.purged += conn.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),)).rowcount
+            conn.commit()
+        except sqlite3.Error:
+            self.errors += 1
+
+
+# Two-tier result cache: local LRU first, then the optional shared tier
+class ResultCache:
+    def __init__(self, maxsize=4096, ttl=3600, shared_path=None, namespace='', purge_every=1000):
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.shared = SqliteCacheTier(shared_path, ttl=ttl, purge_every=purge_every) if shared_path else None
+        self.namespace = namespace
+
+    def key(self, tos_text, options):
+        return make_cache_key(tos_text, options, self.namespace)
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def stats(self):
+        stats = {
+            "size": len(self.local),
+            "maxsize": self.local.maxsize,
+            "ttl": self.local.ttl,
+            "hits": self.local.hits,
+            "misses": self.local.misses,
+            "evictions": self.local.evictions,
+            "expirations": self.local.expirations,
+        }
+        if self.shared is not None:
+            stats["shared"] = {
+                "path": self.shared.path,
+                "hits": self.shared.hits,
+                "misses": self.shared.misses,
+                "errors": self.shared.errors,
+                "purged": self.shared.purged,
+            }
+        return stats
+
+
+# Build the cache from IPSEE_CACHE_* environment variables
+def cache_from_env(namespace=''):
+    return ResultCache(
+        maxsize=int(os.environ.get('IPSEE_CACHE_SIZE', 4096)),
+        ttl=float(os.environ.get('IPSEE_CACHE_TTL', 3600)),
+        shared_path=os.environ.get('IPSEE_SHARED_CACHE') or None,
+        namespace=namespace,
+        purge_every=int(os.environ.get('IPSEE_SHARED_CACHE_PURGE_EVERY', 1000)),
+    )
@@ -1,8 +1,16 @@
-import spacy
-import torch
+from keyword_matcher import KeywordMatcher
 
-# Load spaCy model for advanced language understanding (trained BERT-based model)
-nlp = spacy.load("./ipsee_ner_model")  # Ensure the path to your model is correct
+# spaCy model for advanced language understanding (trained BERT-based model)
+MODEL_PATH = "./ipsee_ner_model"  # Ensure the path to your model is correct
+nlp = None
+
+# Load the model on first use so importing this module stays cheap
+def get_nlp():
+    global nlp
+    if nlp is None:
+        from serving_model import load_serving_model
+        nlp = load_serving_model(MODEL_PATH)
+    return nlp
 
 # Expanded key phrases to detect GDPR-related terms in TOS
 GDPR_KEYWORDS = {
@@ -14,40 +22,61 @@ GDPR_KEYWORDS = {
     "third_party_sharing": ["share your data", "third-party", "sell your data", "data processors"],
     "outdated_tos": ["last updated", "effective date"],
     "cookie_duration": ["cookie expiration", "how long cookies last"],
-    "deceptive_practices": ["hidden options", "only accept all", "default consent", "forced consent"]
+    "deceptive_practices": ["hidden options", "only accept all", "default consent", "forced consent"],
+    "essential_cookies": ["essential cookies", "strictly necessary cookies"]
 }
 
+# Compiled once: every keyword of every category is found in a single pass
+GDPR_MATCHER = KeywordMatcher(GDPR_KEYWORDS)
+
+# Phrases that identify "accept all" / "reject all" cookie buttons
+COOKIE_OPTION_MATCHER = KeywordMatcher({
+    "accept_all": ["accept all cookies", "allow all cookies", "agree to all cookies"],
+    "reject_all": ["reject all cookies", "deny all cookies", "block all cookies"]
+})
+
+# Decision of the default fallback, when the rules cannot settle the case
+FALLBACK_DECISION = "Further investigation required."
+
 # Function to analyze TOS using BERT-based model and rule-based logic
 def analyze_tos_and_cookies(tos_txt, cookies_options):
     # Step 1: Use BERT-based model to analyze the TOS text
-    doc = nlp(tos_txt)
+    doc = get_nlp()(tos_txt)
     
     # Step 2: Rule-based GDPR compliance check
+    return apply_rules(tos_txt, cookies_options)[0]
+
+# Rule-based GDPR compliance check on its own, without the model. Returns the decision and
+# the findings behind it (violation and compliance messages, keyword categories, cookie options).
+def apply_rules(tos_txt, cookies_options, verbose=True):
     gdpr_violations = []
     compliance_info = []
     transparency_info = []
 
-    # Analyze TOS text for GDPR compliance based on key phrases
-    data_collection_found = any(keyword in tos_txt.lower() for keyword in GDPR_KEYWORDS["data_collection"])
-    user_rights_found = any(keyword in tos_txt.lower() for keyword in GDPR_KEYWORDS["user_rights"])
-    consent_mechanism_found = any(keyword in tos_txt.lower() for keyword in GDPR_KEYWORDS["consent_mechanism"])
-    implicit_consent_found = any(keyword in tos_txt.lower() for keyword in GDPR_KEYWORDS["implicit_consent"])
-    broad_data_collection_found = any(keyword in tos_txt.lower() for keyword in GDPR_KEYWORDS["broad_data_collection"])
-    third_party_sharing_found = any(keyword in tos_txt.lower() for keyword in GDPR_KEYWORDS["third_party_sharing"])
-    outdated_tos_found = any(keyword in tos_txt.lower() for keyword in GDPR_KEYWORDS["outdated_tos"])
-    cookie_duration_found = any(keyword in tos_txt.lower() for keyword in GDPR_KEYWORDS["cookie_duration"])
-    deceptive_practices_found = any(keyword in tos_txt.lower() for keyword in GDPR_KEYWORDS["deceptive_practices"])
+    # Analyze TOS text for GDPR compliance based on key phrases (one pass over the text)
+    matches = GDPR_MATCHER.find_all(tos_txt)
+    found_categories = {category for _, _, category, _ in matches}
+    data_collection_found = "data_collection" in found_categories
+    user_rights_found = "user_rights" in found_categories
+    consent_mechanism_found = "consent_mechanism" in found_categories
+    implicit_consent_found = "implicit_consent" in found_categories
+    broad_data_collection_found = "broad_data_collection" in found_categories
+    third_party_sharing_found = "third_party_sharing" in found_categories
+    outdated_tos_found = "outdated_tos" in found_categories
+    cookie_duration_found = "cookie_duration" in found_categories
+    deceptive_practices_found = "deceptive_practices" in found_categories
 
     # Print debug info for transparency
-    print(f"Data Collection Found: {data_collection_found}")
-    print(f"User Rights Found: {user_rights_found}")
-    print(f"Consent Mechanism Found: {consent_mechanism_found}")
-    print(f"Implicit Consent Found: {implicit_consent_found}")
-    print(f"Broad Data Collection Found: {broad_data_collection_found}")
-    print(f"Third Party Sharing Found: {third_party_sharing_found}")
-    print(f"Outdated TOS Found: {outdated_tos_found}")
-    print(f"Cookie Duration Found: {cookie_duration_found}")
-    print(f"Deceptive Practices Found: {deceptive_practices_found}")
+    if verbose:
+        print(f"Data Collection Found: {data_collection_found}")
+        print(f"User Rights Found: {user_rights_found}")
+        print(f"Consent Mechanism Found: {consent_mechanism_found}")
+        print(f"Implicit Consent Found: {implicit_consent_found}")
+        print(f"Broad Data Collection Found: {broad_data_collection_found}")
+        print(f"Third Party Sharing Found: {third_party_sharing_found}")
+        print(f"Outdated TOS Found: {outdated_tos_found}")
+        print(f"Cookie Duration Found: {cookie_duration_found}")
+        print(f"Deceptive Practices Found: {deceptive_practices_found}")
 
     # Apply advanced logic to analyze GDPR compliance
     if data_collection_found:
@@ -77,12 +106,21 @@ def analyze_tos_and_cookies(tos_txt, cookies_options):
     if deceptive_practices_found:
         gdpr_violations.append("The TOS uses deceptive practices such as hiding or obscuring cookie options, violating GDPR.")
 
-    # Analyze cookie options
-    accept_phrases = ["accept all cookies", "allow all cookies", "agree to all cookies"]
-    reject_phrases = ["reject all cookies", "deny all cookies", "block all cookies"]
-    
-    has_accept_all = any(phrase in option.lower() for option in cookies_options for phrase in accept_phrases)
-    has_reject_all = any(phrase in option.lower() for option in cookies_options for phrase in reject_phrases)
+    # Analyze cookie options (options are joined by newlines so no phrase can span two of them)
+    found_options = COOKIE_OPTION_MATCHER.categories_found("\n".join(cookies_options))
+    has_accept_all = "accept_all" in found_options
+    has_reject_all = "reject_all" in found_options
+    essential_only = "essential cookies" in [option.lower() for option in cookies_options]
+
+    findings = {
+        "violations": gdpr_violations,
+        "compliance": compliance_info,
+        "categories": found_categories,
+        "matches": matches,
+        "accept_all": has_accept_all,
+        "reject_all": has_reject_all,
+        "essential_only": essential_only,
+    }
 
     # Scenario: Both "accept all" and "reject all" options present (Compliant)
     if has_accept_all and has_reject_all:
@@ -93,14 +131,14 @@ def analyze_tos_and_cookies(tos_txt, cookies_options):
             "suggestion": "Based on the analysis, it's safe to either accept all cookies or reject cookies as per your preference.",
             "summary": f"Important GDPR elements in the TOS: {', '.join(compliance_info)}",
             "explanation": "The website is GDPR compliant based on cookie options and TOS content."
-        }
+        }, findings
 
     # Scenario: No "reject all" option (Non-compliant)
     if has_accept_all and not has_reject_all:
         gdpr_violations.append("The TOS provides an 'accept all' option but lacks a 'reject all' option, violating GDPR's consent requirements.")
 
     # Scenario: Only essential cookies allowed (Compliant)
-    if "essential cookies" in [option.lower() for option in cookies_options]:
+    if essential_only:
         compliance_info.append("The TOS provides an option to accept only essential cookies, which complies with GDPR.")
         return {
             "decision": "User can accept only essential cookies.",
@@ -108,7 +146,7 @@ def analyze_tos_and_cookies(tos_txt, cookies_options):
             "suggestion": "Based on the analysis, you can safely accept only essential cookies.",
             "summary": f"Important GDPR elements in the TOS: {', '.join(compliance_info)}",
             "explanation": "The website is GDPR compliant based on cookie options and TOS content."
-        }
+        }, findings
 
     # Final decision for non-compliance cases
     if gdpr_violations:
@@ -118,43 +156,45 @@ def analyze_tos_and_cookies(tos_txt, cookies_options):
             "suggestion": "Based on the analysis, it's recommended to reject all cookies or avoid using this website.",
             "summary": f"Important GDPR violations in the TOS: {', '.join(gdpr_violations)}",
             "explanation": f"The website does not comply with GDPR. Reasons: {'; '.join(gdpr_violations)}"
-        }
+        }, findings
 
     # Default fallback decision
     return {
-        "decision": "Further investigation required.",
+        "decision": FALLBACK_DECISION,
         "compliance": False,
         "suggestion": "The website's compliance status is unclear. Further review is needed.",
         "summary": "The TOS does not provide sufficient information for compliance.",
         "explanation": "The TOS lacks critical elements to make a compliance decision."
-    }
-
-# Example input for testing the final model
-tos_example_compliant = """
-This website uses cookies to enhance user experience. You can choose to accept all cookies or reject all cookies. 
-We only collect essential data and describe how you can withdraw consent.
-"""
-cookie_options_compliant = ["Accept All", "Reject All", "Manage Preferences"]
-
-tos_example_non_compliant = """
-This website uses cookies to enhance user experience. By using this website, you agree to allow all cookies. 
-We collect personal data for marketing purposes, but no option to reject cookies is provided. 
-By continuing to browse, we assume your consent.
-"""
-cookie_options_non_compliant = ["Accept All", "Manage Preferences"]
-
-# Analyze the TOS and cookie options for compliant case
-result_compliant = analyze_tos_and_cookies(tos_example_compliant, cookie_options_compliant)
-print(f"Decision: {result_compliant['decision']}")
-print(f"Compliance with GDPR: {result_compliant['compliance']}")
-print(f"Suggestion: {result_compliant['suggestion']}")
-print(f"Summary: {result_compliant['summary']}")
-print(f"Explanation: {result_compliant['explanation']}")
-
-# Analyze the TOS and cookie options for non-compliant case
-result_non_compliant = analyze_tos_and_cookies(tos_example_non_compliant, cookie_options_non_compliant)
-print(f"Decision: {result_non_compliant['decision']}")
-print(f"Compliance with GDPR: {result_non_compliant['compliance']}")
-print(f"Suggestion: {result_non_compliant['suggestion']}")
-print(f"Summary: {result_non_compliant['summary']}")
-print(f"Explanation: {result_non_compliant['explanation']}")
+    }, findings
+
+# Run the example analyses only when executed directly, never on import
+if __name__ == "__main__":
+    # Example input for testing the final model
+    tos_example_compliant = """
+    This website uses cookies to enhance user experience. You can choose to accept all cookies or reject all cookies. 
+    We only collect essential data and describe how you can withdraw consent.
+    """
+    cookie_options_compliant = ["Accept All", "Reject All", "Manage Preferences"]
+
+    tos_example_non_compliant = """
+    This website uses cookies to enhance user experience. By using this website, you agree to allow all cookies. 
+    We collect personal data for marketing purposes, but no option to reject cookies is provided. 
+    By continuing to browse, we assume your consent.
+    """
+    cookie_options_non_compliant = ["Accept All", "Manage Preferences"]
+
+    # Analyze the TOS and cookie options for compliant case
+    result_compliant = analyze_tos_and_cookies(tos_example_compliant, cookie_options_compliant)
+    print(f"Decision: {result_compliant['decision']}")
+    print(f"Compliance with GDPR: {result_compliant['compliance']}")
+    print(f"Suggestion: {result_compliant['suggestion']}")
+    print(f"Summary: {result_compliant['summary']}")
+    print(f"Explanation: {result_compliant['explanation']}")
+
+    # Analyze the TOS and cookie options for non-compliant case
+    result_non_compliant = analyze_tos_and_cookies(tos_example_non_compliant, cookie_options_non_compliant)
+    print(f"Decision: {result_non_compliant['decision']}")
+    print(f"Compliance with GDPR: {result_non_compliant['compliance']}")
+    print(f"Suggestion: {result_non_compliant['suggestion']}")
+    print(f"Summary: {result_non_compliant['summary']}")
+    print(f"Explanation: {result_non_compliant['explanation']}")
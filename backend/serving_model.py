@@ -0,0 +1,71 @@
+import json
+import sys
+from pathlib import Path
+
+import spacy
+
+from onnx_ner import ONNX_FORMAT, OnnxNerModel
+
+# Key in meta.json listing the components inference can skip
+SERVING_EXCLUDE_KEY = "serving_exclude"
+
+
+# Shared embedding components (tok2vec / transformer) that the NER reads through a listener.
+# In en_core_web_sm-based models the NER has its own embedding layer, so this is usually empty.
+def ner_dependencies(nlp):
+    dependencies = []
+    for name, component in nlp.pipeline:
+        if "ner" in getattr(component, "listening_components", []):
+            dependencies.append(name)
+    return dependencies
+
+
+# Every component that does not contribute to doc.ents
+def serving_exclude(nlp):
+    keep = {"ner", *ner_dependencies(nlp)}
+    return [name for name in nlp.component_names if name not in keep]
+
+
+# Record the excluded components in the model's meta so the saved model carries them
+def mark_for_serving(nlp):
+    nlp.meta[SERVING_EXCLUDE_KEY] = serving_exclude(nlp)
+    return nlp.meta[SERVING_EXCLUDE_KEY]
+
+
+def _read_meta(model_path):
+    meta_path = Path(model_path) / "meta.json"
+    if not meta_path.exists():
+        return {}
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Load only the tokenizer, the NER and whatever the NER listens to. Models saved without
+# the serving_exclude entry are loaded in full and trimmed in memory. Directories exported
+# to ONNX (distill_student.py --transformer-student) are served with ONNX Runtime instead of spaCy.
+def load_serving_model(model_path):
+    meta = _read_meta(model_path)
+    if meta.get("format") == ONNX_FORMAT:
+        return OnnxNerModel(model_path)
+
+    exclude = meta.get(SERVING_EXCLUDE_KEY)
+    if exclude is not None:
+        return spacy.load(model_path, exclude=exclude)
+
+    nlp = spacy.load(model_path)
+    for name in serving_exclude(nlp):
+        nlp.remove_pipe(name)
+    return nlp
+
+
+# Mark an already trained model directory for serving without retraining it:
+#   python serving_model.py ./ipsee_ner_model
+if __name__ == "__main__":
+    model_path = sys.argv[1] if len(sys.argv) > 1 else "./ipsee_ner_model"
+    excluded = serving_exclude(spacy.load(model_path))
+
+    meta = _read_meta(model_path)
+    meta[SERVING_EXCLUDE_KEY] = excluded
+    with open(Path(model_path) / "meta.json", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    print(f"Serving mode for {model_path} excludes: {', '.join(excluded) or 'nothing'}")
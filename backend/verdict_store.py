@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+from result_cache import normalize_options, normalize_text
+
+
+# Hash the client sends instead of the text: SHA-256 of the whitespace-normalized TOS, UTF-8
+def tos_sha256(tos_text):
+    return hashlib.sha256(normalize_text(tos_text).encode('utf-8')).hexdigest()
+
+
+# Verdicts also depend on the cookie options and the model that produced them
+def options_key(options, namespace=''):
+    payload = json.dumps([namespace, normalize_options(options)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def domain_of(url):
+    host = urlsplit(url if '//' in (url or '') else f"//{url or ''}").hostname or ''
+    return host[4:] if host.startswith('www.') else host
+
+
+# Verdicts of every analysed TOS, kept in a SQLite file and looked up by the hash of the
+# text, so a client that already knows the hash does not need to upload the text again.
+# Rows are keyed by hash, options and domain; like the shared cache tier, one connection per
+# thread and process, WAL mode, errors never fail a request, and rows older than `ttl` are
+# deleted when the store is opened and after every `purge_every` writes.
+class VerdictStore:
+    def __init__(self, path, ttl=30 * 24 * 3600, purge_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.writes = 0
+        self.purged = 0
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "tos_sha256 TEXT NOT NULL, options_key TEXT NOT NULL, domain TEXT NOT NULL, "
+            "verdict TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (tos_sha256, options_key, domain))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS verdicts_updated_at ON verdicts (updated_at)")
+        conn.commit()
+        self.purge_expired()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # Stored verdict for a text hash and options, preferring the row of the same domain
+    # (the same text seen on another site is still the same verdict)
+    def lookup(self, sha256, options, namespace='', url=''):
+        try:
+            row = self._connect().execute(
+                "SELECT verdict FROM verdicts WHERE tos_sha256 = ? AND options_key = ? AND updated_at >= ? "
+                "ORDER BY domain = ? DESC, updated_at DESC LIMIT 1",
+                (sha256, options_key(options, namespace), time.time() - self.ttl, domain_of(url)),
+            ).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def record(self, sha256, options, namespace, url, verdict):
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO verdicts (tos_sha256, options_key, domain, verdict, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (sha256, options_key(options, namespace), domain_of(url),
+                 json.dumps(verdict, ensure_ascii=False), time.time()),
+            )
+            conn.commit()
+        except sqlite3.Error:
+            self.errors += 1
+            return
+        self.writes += 1
+        if self.purge_every and self.writes % self.purge_every == 0:
+            self.purge_expired()
+
+    # Drop verdicts past the TTL (lookup already ignores them) so the file does not grow
+    # without bound
+    def purge_expired(self):
+        try:
+            conn = self._connect()
+            self.purged += conn.execute("DELETE FROM verdicts WHERE updated_at < ?",
+                                        (time.time() - self.ttl,)).rowcount
+            conn.commit()
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self):
+        return {"path": self.path, "hits": self.hits, "misses": self.misses, "errors": self.errors,
+                "purged": self.purged}
+
+
+# Store configured from IPSEE_VERDICT_DB / IPSEE_VERDICT_TTL / IPSEE_VERDICT_PURGE_EVERY, or
+# None when the path is unset
+def verdict_store_from_env():
+    path = os.environ.get('IPSEE_VERDICT_DB')
+    if not path:
+        return None
+    return VerdictStore(path, ttl=float(os.environ.get('IPSEE_VERDICT_TTL', 30 * 24 * 3600)),
+                        purge_every=int(os.environ.get('IPSEE_VERDICT_PURGE_EVERY', 1000)))
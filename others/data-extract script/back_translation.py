@@ -0,0 +1,58 @@
+import threading
+from contextlib import nullcontext
+
+import torch
+from transformers import MarianMTModel, MarianTokenizer
+
+# Set device to GPU if available, else CPU
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# Process-wide registry: each translation direction is loaded once, on first use
+_MODELS = {}
+_MODELS_LOCK = threading.Lock()
+
+
+def get_translation_model(source_lang, target_lang):
+    key = (source_lang, target_lang)
+    if key not in _MODELS:
+        with _MODELS_LOCK:
+            if key not in _MODELS:
+                name = f'Helsinki-NLP/opus-mt-{source_lang}-{target_lang}'
+                tokenizer = MarianTokenizer.from_pretrained(name)
+                model = MarianMTModel.from_pretrained(name).to(device)
+                model.eval()
+                _MODELS[key] = (tokenizer, model)
+    return _MODELS[key]
+
+
+# Mixed precision only helps on GPU; on CPU autocast would just add overhead
+def _autocast():
+    return torch.cuda.amp.autocast() if device.type == "cuda" else nullcontext()
+
+
+# Translate many texts with as few generate() calls as possible. Texts are sorted by length
+# so each batch pads to similar lengths; results are returned in the input order.
+def translate_batch(texts, source_lang="en", target_lang="fr", batch_size=16, max_length=512):
+    tokenizer, model = get_translation_model(source_lang, target_lang)
+    translations = [None] * len(texts)
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        batch = [texts[i] for i in indices]
+        # Ensure tokenization handles long texts by truncating
+        inputs = tokenizer(batch, return_tensors="pt", padding=True, truncation=True, max_length=max_length).to(device)
+        with torch.inference_mode(), _autocast():
+            generated = model.generate(**inputs)
+        for i, translation in zip(indices, tokenizer.batch_decode(generated, skip_special_tokens=True)):
+            translations[i] = translation
+
+    return translations
+
+
+# Back-translation augmentation (source -> target -> source) for a list of texts
+def back_translate_batch(texts, source_lang="en", target_lang="fr", batch_size=16):
+    if not texts:
+        return []
+    translated = translate_batch(texts, source_lang, target_lang, batch_size=batch_size)
+    return translate_batch(translated, target_lang, source_lang, batch_size=batch_size)
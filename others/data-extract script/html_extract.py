@@ -0,0 +1,216 @@
+import codecs
+import re
+from html.parser import HTMLParser
+
+# Element ids the extension reads directly (see extractTosAndCookieOptions in content.js)
+SECTION_IDS = {"tospopup": "privacy_terms", "cookiepopup": "cookie_banner"}
+
+# Hints in id / class / aria-label that mark a cookie banner or a privacy/terms section
+COOKIE_HINT = re.compile(r'cookie|consent|gdpr|onetrust|didomi|cookiebot|usercentrics|truste|(?<![a-z])cmp(?![a-z])', re.I)
+TERMS_HINT = re.compile(r'privacy|terms|(?<![a-z])tos(?![a-z])|legal|policy', re.I)
+
+# Never contains visible text
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "object", "canvas"}
+
+# Page chrome dropped from the fallback text of a privacy/terms page. Privacy/terms sections
+# are not looked for inside it either: their "Privacy" / "Terms" links are navigation.
+BOILERPLATE_TAGS = {"nav", "header", "footer", "aside", "menu"}
+
+# A privacy/terms section found by its id/class hints needs at least this much text outside
+# links; shorter ones are lists of links to the policy pages, not the policy itself
+MIN_TERMS_TEXT_CHARS = 80
+
+# Tags that separate words when their text is joined
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "li", "ul", "ol", "br", "h1", "h2", "h3", "h4", "h5", "h6",
+    "table", "tr", "td", "th", "button", "label", "dialog", "form", "blockquote", "dd", "dt",
+}
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+# Elements that can hold a whole banner or policy section (links and buttons merely mention one)
+CONTAINER_TAGS = {"div", "section", "article", "aside", "dialog", "form", "main", "footer", "header"}
+
+
+# Which kind of section an element starts, or None
+def section_kind(tag, attrs):
+    attrs = dict(attrs)
+    element_id = (attrs.get("id") or "").lower()
+    if element_id in SECTION_IDS:
+        return SECTION_IDS[element_id]
+    if tag not in CONTAINER_TAGS:
+        return None
+    hints = " ".join(attrs.get(name) or "" for name in ("id", "class", "aria-label", "aria-labelledby"))
+    if COOKIE_HINT.search(hints):
+        role = (attrs.get("role") or "").lower()
+        return "consent_dialog" if tag == "dialog" or role in ("dialog", "alertdialog") else "cookie_banner"
+    if TERMS_HINT.search(hints):
+        return "privacy_terms"
+    return None
+
+
+# Streaming HTML-to-text extractor. Markup, scripts and styles are dropped and only the text
+# of cookie banners, consent dialogs and privacy/terms sections is kept, each with its
+# character offsets in the source HTML and the labels of its buttons. Pages without such a
+# section whose <title> names a privacy/terms/cookie page fall back to their main text.
+class SectionExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sections = []
+        self.title = ""
+        self._stack = []
+        self._skip_depth = 0
+        self._boilerplate_depth = 0
+        self._link_depth = 0
+        self._in_title = False
+        self._section = None
+        self._button = None
+        self._fallback = []
+        self._line_starts = [0]
+        self._fed = 0
+
+    # Track where each source line starts so getpos() can be turned into a character offset
+    def feed(self, data):
+        for match in re.finditer('\n', data):
+            self._line_starts.append(self._fed + match.end())
+        self._fed += len(data)
+        super().feed(data)
+
+    def _offset(self):
+        line, column = self.getpos()
+        return self._line_starts[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._append(" ")
+        if tag in VOID_TAGS:
+            return
+        self._stack.append(tag)
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in BOILERPLATE_TAGS:
+            self._boilerplate_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "a":
+            self._link_depth += 1
+        elif tag == "button" and self._section is not None:
+            self._button = []
+
+        if self._section is None:
+            kind = section_kind(tag, attrs)
+            attrs = dict(attrs)
+            hinted = (attrs.get("id") or "").lower() not in SECTION_IDS
+            if kind == "privacy_terms" and hinted and self._boilerplate_depth:
+                kind = None
+            if kind is not None:
+                self._section = {
+                    "kind": kind,
+                    "selector": f"#{attrs['id']}" if attrs.get("id") else tag,
+                    "start": self._offset(),
+                    "depth": len(self._stack),
+                    "hinted": hinted,
+                    "link_text": [],
+                    "text": [],
+                    "buttons": [],
+                }
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._append(" ")
+
+    def handle_endtag(self, tag):
+        if tag not in self._stack:
+            return  # stray end tag
+        # Pop implicitly closed elements (e.g. unclosed <p> or <li>) along with this one
+        while self._stack:
+            closed = self._stack.pop()
+            self._close(closed)
+            if closed == tag:
+                break
+        if tag in BLOCK_TAGS:
+            self._append(" ")
+
+    def _close(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth -= 1
+        elif tag in BOILERPLATE_TAGS:
+            self._boilerplate_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+        elif tag == "a":
+            self._link_depth -= 1
+        elif tag == "button" and self._button is not None:
+            label = " ".join("".join(self._button).split())
+            if label and self._section is not None:
+                self._section["buttons"].append(label)
+            self._button = None
+
+        if self._section is not None and len(self._stack) < self._section["depth"]:
+            self._finish_section(self._offset() + len(f"</{tag}>"))
+
+    def _finish_section(self, end):
+        section = self._section
+        section["end"] = end
+        section["text"] = " ".join("".join(section["text"]).split())
+        link_chars = len(" ".join("".join(section.pop("link_text")).split()))
+        hinted = section.pop("hinted")
+        link_list = section["kind"] == "privacy_terms" and hinted and len(section["text"]) - link_chars < MIN_TERMS_TEXT_CHARS
+        del section["depth"]
+        if section["text"] and not link_list:
+            self.sections.append(section)
+        self._section = None
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._in_title:
+            self.title += data
+            return
+        self._append(data)
+
+    def _append(self, data):
+        if self._skip_depth:
+            return
+        if self._section is not None:
+            self._section["text"].append(data)
+            if self._link_depth:
+                self._section["link_text"].append(data)
+            if self._button is not None:
+                self._button.append(data)
+        elif not self._boilerplate_depth:
+            self._fallback.append(data)
+
+    # Sections found so far, falling back to the main text of privacy/terms pages
+    def result(self):
+        if self._section is not None:
+            self._finish_section(self._fed)  # section left open at the end of the page
+        if self.sections:
+            return self.sections
+        if TERMS_HINT.search(self.title) or COOKIE_HINT.search(self.title):
+            text = " ".join("".join(self._fallback).split())
+            if text:
+                return [{"kind": "privacy_terms", "selector": "title", "start": 0, "end": self._fed,
+                         "text": text, "buttons": []}]
+        return []
+
+
+# Extract sections from a binary stream (e.g. a WARC content stream), decoding and parsing
+# it chunk by chunk so the page is never held in memory as one string. Returns None when
+# the stream is longer than `max_bytes`.
+def extract_sections(stream, max_bytes=None, chunk_size=65536, encoding="utf-8"):
+    decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+    extractor = SectionExtractor()
+    total = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if max_bytes is not None and total > max_bytes:
+            return None
+        extractor.feed(decoder.decode(chunk))
+    extractor.feed(decoder.decode(b"", final=True))
+    extractor.close()
+    return extractor.result()
@@ -1,18 +1,21 @@
 import gzip
 import json
 import re
-import spacy
 import logging
 from warcio.archiveiterator import ArchiveIterator
-from transformers import MarianMTModel, MarianTokenizer
 import os
-import torch
+import sys
+from collections import Counter
 
-# Initialize logging
-logging.basicConfig(filename="data_gathering.log", level=logging.INFO)
+# The keyword matcher is shared with the backend's rule-based logic
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend"))
+from keyword_matcher import KeywordMatcher
+from back_translation import back_translate_batch
+from html_extract import extract_sections
+from near_dedup import MinHasher, NearDuplicateIndex, fingerprint
 
-# Define output file
-OUTPUT_FILE = "advanced_gdpr_training_data.json"
+# Define output files: records are streamed to OUTPUT_PREFIX-00000.jsonl.gz, -00001, ...
+OUTPUT_PREFIX = "advanced_gdpr_training_data"
 
 # GDPR Keywords for Annotations
 GDPR_KEYWORDS = {
@@ -33,113 +36,303 @@ COOKIE_OPTIONS_KEYWORDS = [
     "deny all", "block cookies", "accept necessary", "allow all", "disable cookies"
 ]
 
-# Set device to GPU if available, else CPU
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# Compiled once from the keyword lists; each scan is a single pass over the text
+GDPR_MATCHER = KeywordMatcher(GDPR_KEYWORDS)
+COOKIE_OPTIONS_MATCHER = KeywordMatcher({keyword: [keyword] for keyword in COOKIE_OPTIONS_KEYWORDS})
 
-# Initialize the spaCy model and ensure it runs on GPU if available
-spacy.prefer_gpu()
-nlp = spacy.load("en_core_web_trf")
+# Pre-filter thresholds: only successful HTML/text responses of bounded size that mention at
+# least MIN_RELEVANCE_SCORE distinct GDPR/cookie keywords reach spaCy and back-translation
+ALLOWED_MIME_TYPES = {"text/html", "application/xhtml+xml", "text/plain"}
+MAX_CONTENT_BYTES = 2000000
+MIN_RELEVANCE_SCORE = 2
 
-# Handle large input sizes for spaCy
-nlp.max_length = 2000000  # Increased to handle larger text
+RELEVANCE_MATCHER = KeywordMatcher({**GDPR_KEYWORDS, "cookie_options": COOKIE_OPTIONS_KEYWORDS})
+
+# Per-stage counters of the pre-filter (records seen, dropped at each stage, kept)
+FILTER_STATS = Counter()
+
+# Near-duplicate collapsing: a document whose estimated Jaccard similarity to an earlier one
+# is at least DEDUP_THRESHOLD is counted against that document's cluster and not processed.
+# Signatures are computed here; the index may be a proxy shared by several processes.
+DEDUP_THRESHOLD = 0.9
+DEDUP_INDEX = NearDuplicateIndex(threshold=DEDUP_THRESHOLD)
+DEDUP_HASHER = MinHasher()
+
+# Documents this process assigned to each cluster
+CLUSTER_COUNTS = Counter()
 
 # Clean and preprocess the text (optional but helps with consistency)
 def clean_text(text):
     return re.sub(r'\s+', ' ', text).strip()
 
-# Annotate the text with GDPR-related labels using advanced spaCy processing
-def annotate_text(text):
-    annotations = []
-    doc = nlp(text)
-    for label, keywords in GDPR_KEYWORDS.items():
-        for keyword in keywords:
-            start = text.lower().find(keyword)
-            if start != -1:
-                end = start + len(keyword)
-                annotations.append({"start": start, "end": end, "label": label.upper()})
-    return annotations
+# Annotate the text with GDPR-related labels from the keyword matcher (no model parse needed).
+# Every occurrence of every keyword is recorded; pass `matches` to reuse an earlier scan.
+def annotate_text(text, matches=None):
+    if matches is None:
+        matches = GDPR_MATCHER.find_all(text)
+    return [{"start": start, "end": end, "label": label.upper()} for start, end, label, _ in matches]
 
 # Extract cookie options from TOS text
 def extract_cookie_options(text):
-    cookie_options = []
-    for keyword in COOKIE_OPTIONS_KEYWORDS:
-        if keyword in text.lower():
-            cookie_options.append(keyword)
-    return list(set(cookie_options))  # Remove duplicates
+    return sorted(COOKIE_OPTIONS_MATCHER.categories_found(text))  # Remove duplicates
 
-# Back-translation augmentation using MarianMT on GPU
+# Back-translation augmentation for a single text (models come from the shared registry)
 def back_translate(text, source_lang="en", target_lang="fr"):
-    tokenizer = MarianTokenizer.from_pretrained(f'Helsinki-NLP/opus-mt-{source_lang}-{target_lang}')
-    model = MarianMTModel.from_pretrained(f'Helsinki-NLP/opus-mt-{source_lang}-{target_lang}').to(device)
-
-    # Ensure tokenization handles long texts by truncating
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device)
-    
-    # Forward pass on GPU
-    with torch.cuda.amp.autocast():
-        translated = model.generate(**inputs)
-        translation = tokenizer.decode(translated[0], skip_special_tokens=True)
-
-    # Translate back to original language
-    tokenizer_back = MarianTokenizer.from_pretrained(f'Helsinki-NLP/opus-mt-{target_lang}-{source_lang}')
-    model_back = MarianMTModel.from_pretrained(f'Helsinki-NLP/opus-mt-{target_lang}-{source_lang}').to(device)
-
-    inputs_back = tokenizer_back(translation, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device)
-    
-    with torch.cuda.amp.autocast():
-        back_translated = model_back.generate(**inputs_back)
-        back_translation = tokenizer_back.decode(back_translated[0], skip_special_tokens=True)
-
-    return back_translation
-
-# Function to process multiple WARC files in a directory
-def process_warc_files_in_directory(warc_dir):
-    combined_data = []
+    return back_translate_batch([text], source_lang, target_lang)[0]
+
+# Batched augmentation stage: buffers `buffer_size` records, back-translates their texts
+# together (length-sorted batches of `batch_size` per generate call) and yields the records
+# in their original order
+def augment_records(records, batch_size=16, buffer_size=256):
+    buffer = []
+    for record in records:
+        buffer.append(record)
+        if len(buffer) >= buffer_size:
+            yield from _augment_buffer(buffer, batch_size)
+            buffer = []
+    if buffer:
+        yield from _augment_buffer(buffer, batch_size)
+
+def _augment_buffer(buffer, batch_size):
+    try:
+        translations = back_translate_batch([record["text"] for record in buffer], batch_size=batch_size)
+    except Exception as e:
+        logging.error(f"Error back-translating {len(buffer)} records: {e}")
+        translations = [None] * len(buffer)
+    for record, translation in zip(buffer, translations):
+        record["back_translated_text"] = translation
+        yield record
+
+# Build the training record for one cleaned TOS text (back-translation happens later, in batches)
+def process_text(tos_text):
+    matches = GDPR_MATCHER.find_all(tos_text)
+    annotations = annotate_text(tos_text, matches)
+    cookie_options = extract_cookie_options(tos_text)
+
+    found_categories = {label for _, _, label, _ in matches}
+    gdpr_compliance = {
+        "data_collection": "data_collection" in found_categories,
+        "user_rights": "user_rights" in found_categories,
+        "consent_mechanism": "consent_mechanism" in found_categories
+    }
+
+    return {
+        "text": tos_text,
+        "back_translated_text": None,  # filled in by the batched augmentation stage
+        "gdpr_compliance": gdpr_compliance,
+        "cookie_options": cookie_options,
+        "annotations": annotations
+    }
+
+# Yield (offset, record) for every response record of an open WARC file. Offsets are byte
+# positions in the compressed file (also after a seek), so a reader can seek straight back
+# to any record. archive.offset is read instead of get_record_offset(), which would read
+# the record to its end before its content has been consumed.
+def iter_warc_responses(f):
+    archive = ArchiveIterator(f)
+    for record in archive:
+        if record.rec_type == 'response':
+            yield archive.offset, record
+
+# MIME type of a response record, without parameters such as the charset
+def response_mime_type(record):
+    return (record.http_headers.get_header("Content-Type") or "").split(";")[0].strip().lower()
+
+# Stage 1 of the pre-filter: drop records by HTTP status and MIME type, from headers only
+def prefilter_headers(record):
+    headers = record.http_headers
+    if headers is None:
+        return "dropped_no_http_headers"
+    status = headers.get_statuscode() or ""
+    if not status.startswith("2"):
+        return "dropped_status"
+    if response_mime_type(record) not in ALLOWED_MIME_TYPES:
+        return "dropped_mime_type"
+    return None
+
+# Text of a response body plus the page sections it came from. HTML is parsed as a stream
+# and reduced to its cookie banner / consent dialog / privacy-terms sections; plain text
+# is only whitespace-cleaned. Returns (text, sections, drop_reason).
+def extract_record_text(record):
+    stream = record.content_stream()
+    if response_mime_type(record) == "text/plain":
+        # Read one byte past the limit to detect oversized bodies without reading them whole
+        body = stream.read(MAX_CONTENT_BYTES + 1)
+        if len(body) > MAX_CONTENT_BYTES:
+            return None, None, "dropped_too_large"
+        # Decode with error handling to skip invalid UTF-8 characters
+        return clean_text(body.decode('utf-8', errors='ignore')), [], None
+
+    sections = extract_sections(stream, max_bytes=MAX_CONTENT_BYTES)
+    if sections is None:
+        return None, None, "dropped_too_large"
+    if not sections:
+        return None, None, "dropped_no_sections"
+
+    # Join the sections and record where each one sits in the joined text
+    parts = []
+    position = 0
+    for section in sections:
+        section["text_start"] = position
+        section["text_end"] = position + len(section["text"])
+        parts.append(section.pop("text"))
+        position = section["text_end"] + 1
+    return " ".join(parts), sections, None
+
+# Number of distinct GDPR / cookie-option keywords in the text
+def relevance_score(text):
+    return len({keyword for _, _, _, keyword in RELEVANCE_MATCHER.find_all(text)})
+
+# Stage 2 of the pre-filter: drop empty pages and pages that are clearly not cookie banners
+# or terms pages, using one pass of the keyword matcher
+def prefilter_text(text):
+    if not text:
+        return "dropped_empty"
+    if relevance_score(text) < MIN_RELEVANCE_SCORE:
+        return "dropped_low_relevance"
+    return None
 
+# Turn one WARC response record into a training record, or None if it is filtered out or
+# cannot be processed. The cheap stages run first so irrelevant pages never reach spaCy.
+def process_warc_record(record, warc_file, offset):
+    FILTER_STATS["seen"] += 1
+    try:
+        reason = prefilter_headers(record)
+        if reason is None:
+            tos_text, sections, reason = extract_record_text(record)
+        if reason is None:
+            reason = prefilter_text(tos_text)
+        if reason is None and DEDUP_INDEX is not None:
+            digest, signature = fingerprint(tos_text, DEDUP_HASHER)
+            cluster_id, duplicate = DEDUP_INDEX.add_fingerprint(digest, signature, f"{warc_file}:{offset}")
+            CLUSTER_COUNTS[cluster_id] += 1
+            if duplicate:
+                reason = "dropped_near_duplicate"
+        if reason is not None:
+            FILTER_STATS[reason] += 1
+            return None
+
+        FILTER_STATS["kept"] += 1
+        result = process_text(tos_text)
+        result["sections"] = sections
+        if DEDUP_INDEX is not None:
+            result["cluster_id"] = cluster_id
+        result["source"] = {"warc_file": warc_file, "offset": offset}
+        return result
+    except Exception as e:
+        logging.error(f"Error processing record at offset {offset} in {warc_file}: {e}")
+        return None
+
+# Generator over the processed records of every WARC file in a directory. Records are
+# yielded as soon as they are built, so nothing accumulates in memory.
+def process_warc_files_in_directory(warc_dir):
     # Iterate over each WARC file in the directory
-    for warc_file in os.listdir(warc_dir):
+    for warc_file in sorted(os.listdir(warc_dir)):
         if warc_file.endswith(".warc.gz"):
-            file_path = os.path.join(warc_dir, warc_file)
-            with gzip.open(file_path, 'rb') as f:
+            # ArchiveIterator decompresses the gzip members itself
+            with open(os.path.join(warc_dir, warc_file), 'rb') as f:
                 logging.info(f"Processing WARC file: {warc_file}")
-                for record in ArchiveIterator(f):
-                    if record.rec_type == 'response':
-                        try:
-                            # Decode with error handling to skip invalid UTF-8 characters
-                            content = record.content_stream().read().decode('utf-8', errors='ignore')
-                            tos_text = clean_text(content)
-                            annotations = annotate_text(tos_text)
-                            cookie_options = extract_cookie_options(tos_text)
-                            back_translated_text = back_translate(tos_text)
-
-                            gdpr_compliance = {
-                                "data_collection": any(keyword in tos_text.lower() for keyword in GDPR_KEYWORDS["data_collection"]),
-                                "user_rights": any(keyword in tos_text.lower() for keyword in GDPR_KEYWORDS["user_rights"]),
-                                "consent_mechanism": any(keyword in tos_text.lower() for keyword in GDPR_KEYWORDS["consent_mechanism"])
-                            }
-
-                            combined_data.append({
-                                "text": tos_text,
-                                "back_translated_text": back_translated_text,
-                                "gdpr_compliance": gdpr_compliance,
-                                "cookie_options": cookie_options,
-                                "annotations": annotations
-                            })
-                        except Exception as e:
-                            logging.error(f"Error processing record in {warc_file}: {e}")
-
-    return combined_data
-
-# Save combined data to JSON
-def save_to_json(data, output_file):
+                for offset, record in iter_warc_responses(f):
+                    result = process_warc_record(record, warc_file, offset)
+                    if result is not None:
+                        yield result
+    log_filter_stats()
+
+# Documents per near-duplicate cluster, keyed by the cluster id stored on the kept record
+def save_cluster_counts(counts, output_file):
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    logging.info(f"Combined data saved to {output_file}")
+        json.dump(dict(counts), f)
+    logging.info(f"Cluster counts for {len(counts)} clusters saved to {output_file}")
+
+# Report the pre-filter counters
+def log_filter_stats(stats=None):
+    stats = FILTER_STATS if stats is None else stats
+    summary = ", ".join(f"{stage}={count}" for stage, count in sorted(stats.items()))
+    logging.info(f"Pre-filter: {summary}")
+    print(f"Pre-filter: {summary}")
+
+# Streams records to gzip-compressed JSONL shards of at most `records_per_shard` lines.
+# A shard is written under a ".tmp" name and renamed once complete, and the open shard is
+# flushed every `flush_every` records, so a crash loses at most those last records.
+# `on_shard_closed(path, records)` is called after each shard is renamed into place.
+class JsonlShardWriter:
+    def __init__(self, output_prefix, records_per_shard=10000, flush_every=100, first_shard_index=0, on_shard_closed=None):
+        self.output_prefix = output_prefix
+        self.records_per_shard = records_per_shard
+        self.flush_every = flush_every
+        self.on_shard_closed = on_shard_closed
+        self.shard_index = first_shard_index
+        self.records_in_shard = 0
+        self.records_written = 0
+        self.shard_paths = []
+        self._file = None
+        self._tmp_path = None
+
+    def _shard_path(self):
+        return f"{self.output_prefix}-{self.shard_index:05d}.jsonl.gz"
+
+    def _open_shard(self):
+        self._tmp_path = self._shard_path() + ".tmp"
+        self._file = gzip.open(self._tmp_path, 'wt', encoding='utf-8')
+        self.records_in_shard = 0
+
+    def _close_shard(self):
+        if self._file is None:
+            return
+        self._file.close()
+        os.replace(self._tmp_path, self._shard_path())
+        self.shard_paths.append(self._shard_path())
+        logging.info(f"Wrote shard {self._shard_path()} ({self.records_in_shard} records)")
+        if self.on_shard_closed is not None:
+            self.on_shard_closed(self._shard_path(), self.records_in_shard)
+        self._file = None
+        self.shard_index += 1
+
+    def write(self, record):
+        if self._file is None:
+            self._open_shard()
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.records_in_shard += 1
+        self.records_written += 1
+        if self.records_in_shard % self.flush_every == 0:
+            self._file.flush()
+        if self.records_in_shard >= self.records_per_shard:
+            self._close_shard()
+
+    def close(self):
+        self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# Stream records into JSONL shards; memory use does not depend on the corpus size
+def save_to_jsonl(records, output_prefix, records_per_shard=10000):
+    with JsonlShardWriter(output_prefix, records_per_shard=records_per_shard) as writer:
+        for record in records:
+            writer.write(record)
+    logging.info(f"Streamed {writer.records_written} records to {len(writer.shard_paths)} shard(s) at {output_prefix}-*.jsonl.gz")
+    return writer.shard_paths
+
+# Read the records of one or more JSONL shards back, one at a time
+def iter_jsonl(paths):
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
 
 # Main script execution
 if __name__ == "__main__":
+    # Initialize logging (only when run as a script, so importing modules keep their own)
+    logging.basicConfig(filename="data_gathering.log", level=logging.INFO)
+
     warc_dir = "./warc_files"  # Path to the directory where WARC files are stored
-    combined_data = process_warc_files_in_directory(warc_dir)
+    records = augment_records(process_warc_files_in_directory(warc_dir))
 
-    # Save the combined data to JSON
-    save_to_json(combined_data, OUTPUT_FILE)
+    # Stream the records to compressed JSONL shards as they are produced
+    save_to_jsonl(records, OUTPUT_PREFIX)
+    save_cluster_counts(CLUSTER_COUNTS, f"{OUTPUT_PREFIX}-clusters.json")
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import pickle
+import re
+from collections import Counter
+
+import numpy as np
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+# Word 5-gram shingles of the lowercased text
+def shingles(text, size=5):
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+# Stable 32-bit hash (the built-in hash() differs between worker processes)
+def hash32(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=4).digest(), 'little')
+
+
+# MinHash signatures from `num_perm` universal hash functions (a * x + b) mod p. Inputs and
+# coefficients are kept below 2**32 so the products fit in uint64 without overflow.
+class MinHasher:
+    def __init__(self, num_perm=128, seed=1):
+        self.num_perm = num_perm
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MAX_HASH, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        hashes = np.array([hash32(shingle) for shingle in shingles(text)], dtype=np.uint64)
+        if hashes.size == 0:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint32)
+        values = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME
+        return (values & MAX_HASH).min(axis=0).astype(np.uint32)
+
+
+# Exact-copy digest and MinHash signature of a text. Computed by the caller, so an index
+# shared between processes only does the cheap LSH lookup.
+def fingerprint(text, hasher):
+    digest = hashlib.sha1(" ".join(text.lower().split()).encode('utf-8')).hexdigest()
+    return digest, hasher.signature(text)
+
+
+# LSH banding (bands x rows = num_perm) with the highest S-curve threshold
+# (1/bands)^(1/rows) that is still at or below the requested Jaccard similarity. Erring low
+# keeps recall high; candidates are verified against the real threshold afterwards.
+def choose_bands(threshold, num_perm):
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold:
+            best = (bands, rows)
+    return best
+
+
+# Streaming near-duplicate index. add() returns the cluster a document belongs to and
+# whether it is a duplicate of an earlier document. Exact copies are caught by a content
+# hash; near copies by MinHash + LSH, confirmed against the cluster's first document with
+# the estimated Jaccard similarity >= `threshold`. A document whose key is already the
+# cluster's own (the same record processed again after a resume) is not a duplicate.
+class NearDuplicateIndex:
+    def __init__(self, threshold=0.9, num_perm=128):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.hasher = MinHasher(num_perm=num_perm)
+        self.bands, self.rows = choose_bands(threshold, num_perm)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = {}
+        self.exact = {}
+        self.counts = Counter()
+        self.duplicates = 0
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _assign(self, cluster_id, key):
+        duplicate = cluster_id != key
+        self.counts[cluster_id] += 1
+        self.duplicates += duplicate
+        return cluster_id, duplicate
+
+    def add(self, text, key):
+        return self.add_fingerprint(*fingerprint(text, self.hasher), key)
+
+    def add_fingerprint(self, digest, signature, key):
+        if digest in self.exact:
+            return self._assign(self.exact[digest], key)
+
+        band_keys = self._band_keys(signature)
+        candidates = set()
+        for bucket, band_key in zip(self.buckets, band_keys):
+            candidates.update(bucket.get(band_key, ()))
+        for cluster_id in candidates:
+            if np.mean(self.signatures[cluster_id] == signature) >= self.threshold:
+                self.exact[digest] = cluster_id
+                return self._assign(cluster_id, key)
+
+        # A new cluster, represented by this first document
+        self.exact[digest] = key
+        self.signatures[key] = signature
+        for bucket, band_key in zip(self.buckets, band_keys):
+            bucket.setdefault(band_key, []).append(key)
+        return self._assign(key, key)
+
+    # Written to a temporary file and renamed, so a crash never leaves a truncated index
+    def to_disk(self, path):
+        with open(path + ".tmp", 'wb') as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    # A saved index, or a new one when there is none or it used other settings
+    @classmethod
+    def from_disk(cls, path, threshold=0.9, num_perm=128):
+        index = cls(threshold=threshold, num_perm=num_perm)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+            if state["threshold"] == threshold and state["num_perm"] == num_perm:
+                index.__dict__.update(state)
+        return index
+
+    def stats(self):
+        return {"clusters": len(self.signatures), "duplicates": self.duplicates, "threshold": self.threshold,
+                "bands": self.bands, "rows": self.rows}
@@ -0,0 +1,248 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from collections import Counter
+from multiprocessing.managers import BaseManager
+
+import infowar
+from near_dedup import NearDuplicateIndex
+
+# WARC files larger than this are split into several shards at record boundaries
+DEFAULT_MAX_SHARD_BYTES = 256 * 1024 * 1024
+
+# A completed part file (and a manifest checkpoint) every this many records
+DEFAULT_CHECKPOINT_EVERY = 1000
+
+
+def shard_name(warc_file, start, end):
+    return f"{warc_file}@{start}-{'' if end is None else end}"
+
+
+# Byte offsets of the response records of a WARC file (only headers are parsed)
+def index_record_offsets(path):
+    with open(path, 'rb') as f:
+        return [offset for offset, _ in infowar.iter_warc_responses(f)]
+
+
+# Shards of one WARC file: the whole file if it is small, otherwise consecutive byte ranges
+# of roughly `max_shard_bytes` that start on record boundaries
+def plan_file(args):
+    warc_dir, warc_file, max_shard_bytes = args
+    path = os.path.join(warc_dir, warc_file)
+    if os.path.getsize(path) <= max_shard_bytes:
+        return [(warc_file, 0, None)]
+
+    boundaries = [0]
+    for offset in index_record_offsets(path):
+        if offset - boundaries[-1] >= max_shard_bytes:
+            boundaries.append(offset)
+    ends = boundaries[1:] + [None]
+    return [(warc_file, start, end) for start, end in zip(boundaries, ends)]
+
+
+# Checkpoint manifest: one JSON line per event, appended by the workers.
+#   {"shard": ..., "status": "progress", "part": ..., "records": n, "last_offset": o}
+#   {"shard": ..., "status": "done", "filter_stats": {...}, "cluster_counts": path}
+def append_manifest(manifest_path, entry):
+    # A single short write in append mode, so lines from different workers never interleave
+    with open(manifest_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# Completed shards, and for unfinished ones the last written record offset and part count
+def load_manifest(manifest_path):
+    done = set()
+    progress = {}
+    if not os.path.exists(manifest_path):
+        return done, progress
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if entry.get("status") == "done":
+                done.add(entry["shard"])
+            elif entry.get("status") == "progress":
+                state = progress.setdefault(entry["shard"], {"last_offset": None, "parts": 0})
+                state["parts"] += 1
+                if state["last_offset"] is None or entry["last_offset"] > state["last_offset"]:
+                    state["last_offset"] = entry["last_offset"]
+    return done, progress
+
+
+# One near-duplicate index for all workers, so boilerplate seen by one worker is dropped by
+# every other. It lives in a manager process that serves the calls from several threads.
+class SharedDedupIndex:
+    def __init__(self, path, threshold):
+        self.path = path
+        self.index = NearDuplicateIndex.from_disk(path, threshold=threshold)
+        self._lock = threading.Lock()
+
+    def add_fingerprint(self, digest, signature, key):
+        with self._lock:
+            return self.index.add_fingerprint(digest, signature, key)
+
+    def save(self):
+        with self._lock:
+            self.index.to_disk(self.path)
+
+
+class DedupManager(BaseManager):
+    pass
+
+
+DedupManager.register("SharedDedupIndex", SharedDedupIndex)
+
+
+# Sets up the worker before it takes its first shard (translation models are loaded on first
+# use). `dedup_index` is the shared index proxy, or None when deduplication is off.
+def init_worker(threads_per_worker, dedup_index):
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    infowar.DEDUP_INDEX = dedup_index
+
+
+# Process one shard, resuming after `resume_offset` if an earlier run got that far
+def run_shard(task):
+    name = task["shard"]
+    path = os.path.join(task["warc_dir"], task["warc_file"])
+    prefix = os.path.join(task["output_dir"], re.sub(r'[^A-Za-z0-9._-]', '_', name))
+    resume_offset = task["resume_offset"]
+    end = task["end"]
+    last_written = {"offset": resume_offset, "records": 0}
+
+    # The index is saved first, so it covers every record the manifest reports as written
+    # (records processed again after a resume match their own entry and are kept)
+    def save_index():
+        if infowar.DEDUP_INDEX is not None:
+            infowar.DEDUP_INDEX.save()
+
+    def checkpoint(part_path, records):
+        save_index()
+        append_manifest(task["manifest"], {
+            "shard": name, "status": "progress", "part": part_path,
+            "records": records, "last_offset": last_written["offset"],
+        })
+
+    # Records of this shard only, skipping everything up to the last checkpointed record
+    def records():
+        start = task["start"] if resume_offset is None else resume_offset
+        with open(path, 'rb') as f:
+            f.seek(start)
+            for offset, record in infowar.iter_warc_responses(f):
+                if end is not None and offset >= end:
+                    break
+                if resume_offset is not None and offset <= resume_offset:
+                    continue
+                result = infowar.process_warc_record(record, task["warc_file"], offset)
+                if result is not None:
+                    yield result
+
+    infowar.FILTER_STATS.clear()
+    infowar.CLUSTER_COUNTS.clear()
+    try:
+        with infowar.JsonlShardWriter(prefix, records_per_shard=task["checkpoint_every"],
+                                      first_shard_index=task["first_part"], on_shard_closed=checkpoint) as writer:
+            for record in infowar.augment_records(records()):
+                last_written["offset"] = record["source"]["offset"]
+                last_written["records"] += 1
+                writer.write(record)
+    except Exception as e:
+        logging.error(f"Shard {name} failed and will be retried on the next run: {e}")
+        return name, "failed", last_written["records"], dict(infowar.FILTER_STATS)
+
+    stats = dict(infowar.FILTER_STATS)
+    entry = {"shard": name, "status": "done", "filter_stats": stats}
+    if infowar.DEDUP_INDEX is not None:
+        # Documents this shard added to each cluster; summing all shards' files gives the totals
+        entry["cluster_counts"] = f"{prefix}-clusters.json"
+        infowar.save_cluster_counts(infowar.CLUSTER_COUNTS, entry["cluster_counts"])
+    save_index()
+    append_manifest(task["manifest"], entry)
+    return name, "done", last_written["records"], stats
+
+
+# Shard plan is computed once per output directory and reused when resuming
+def load_or_create_plan(warc_dir, output_dir, max_shard_bytes, pool):
+    plan_path = os.path.join(output_dir, "plan.json")
+    if os.path.exists(plan_path):
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            return [tuple(shard) for shard in json.load(f)]
+
+    warc_files = sorted(name for name in os.listdir(warc_dir) if name.endswith(".warc.gz"))
+    plan = [shard for shards in pool.map(plan_file, [(warc_dir, name, max_shard_bytes) for name in warc_files])
+            for shard in shards]
+    with open(plan_path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f)
+    return plan
+
+
+# Process a WARC directory across `workers` processes; re-running with the same output
+# directory skips completed shards and resumes unfinished ones after their last checkpoint
+def run(warc_dir, output_dir, workers=None, max_shard_bytes=DEFAULT_MAX_SHARD_BYTES,
+        checkpoint_every=DEFAULT_CHECKPOINT_EVERY, dedup_threshold=infowar.DEDUP_THRESHOLD):
+    workers = workers or multiprocessing.cpu_count()
+    threads_per_worker = max(1, multiprocessing.cpu_count() // workers)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, "manifest.jsonl")
+
+    # The index is kept in the output directory so a resumed run still knows every document
+    # kept before; the manager process serves it to all workers
+    with DedupManager() as manager:
+        dedup_index = None
+        if dedup_threshold:
+            dedup_index = manager.SharedDedupIndex(os.path.join(output_dir, "dedup_index.pkl"), dedup_threshold)
+
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(threads_per_worker, dedup_index)) as pool:
+            plan = load_or_create_plan(warc_dir, output_dir, max_shard_bytes, pool)
+            done, progress = load_manifest(manifest_path)
+
+            tasks = []
+            for warc_file, start, end in plan:
+                name = shard_name(warc_file, start, end)
+                if name in done:
+                    continue
+                state = progress.get(name, {"last_offset": None, "parts": 0})
+                tasks.append({
+                    "shard": name, "warc_dir": warc_dir, "warc_file": warc_file, "start": start, "end": end,
+                    "output_dir": output_dir, "manifest": manifest_path, "checkpoint_every": checkpoint_every,
+                    "resume_offset": state["last_offset"], "first_part": state["parts"],
+                })
+            logging.info(f"{len(plan)} shards planned, {len(done)} already done, {len(tasks)} to run")
+
+            failed = 0
+            filter_stats = Counter()
+            for name, status, records, stats in pool.imap_unordered(run_shard, tasks):
+                failed += status != "done"
+                filter_stats.update(stats)
+                logging.info(f"Shard {name}: {status} ({records} records written in this run)")
+                print(f"Shard {name}: {status} ({records} records)")
+            infowar.log_filter_stats(filter_stats)
+
+    return failed == 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(filename="data_gathering.log", level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Parallel, resumable WARC extraction")
+    parser.add_argument("warc_dir", nargs="?", default="./warc_files")
+    parser.add_argument("output_dir", nargs="?", default="./extracted")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--max-shard-mb", type=int, default=DEFAULT_MAX_SHARD_BYTES // (1024 * 1024))
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY)
+    parser.add_argument("--dedup-threshold", type=float, default=infowar.DEDUP_THRESHOLD,
+                        help="Jaccard similarity at which documents are collapsed (0 disables)")
+    args = parser.parse_args()
+
+    ok = run(args.warc_dir, args.output_dir, workers=args.workers,
+             max_shard_bytes=args.max_shard_mb * 1024 * 1024, checkpoint_every=args.checkpoint_every,
+             dedup_threshold=args.dedup_threshold)
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,157 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+from bench_common import peak_rss_mb, percentile, run_worker
+from demo_corpus import demo_documents, synthetic_corpus
+
+# The service and the rule-based analyzer live in the backend
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+TARGETS = ["api", "rules"]
+
+
+def build_corpus(count, seed):
+    return demo_documents() + synthetic_corpus(count=count, seed=seed)
+
+
+# A callable analysing one document for the given target
+def make_analyzer(target, model_path):
+    if target == "api":
+        # The Flask app in-process, through its test client (no network, same request path)
+        import nlp_api
+        nlp_api.init_service()
+        client = nlp_api.app.test_client()
+
+        def analyze(document):
+            response = client.post('/analyze', json={"tos_text": document["text"], "options": document["options"]})
+            if response.status_code != 200:
+                raise RuntimeError(f"/analyze returned {response.status_code}: {response.get_data(as_text=True)}")
+        return analyze
+
+    import rulebased_logic
+    rulebased_logic.MODEL_PATH = model_path
+    rulebased_logic.get_nlp()
+
+    def analyze(document):
+        # The analyzer takes a list of button labels; the corpus joins them with " | "
+        options = [option for option in document["options"].split(" | ") if option]
+        # The analyzer prints its findings; keep them out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            rulebased_logic.analyze_tos_and_cookies(document["text"], options)
+    return analyze
+
+
+# Measure one target (run through run_worker, in its own process)
+def measure(target, model_path, count, seed, repeats):
+    corpus = build_corpus(count, seed)
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    analyze = make_analyzer(target, model_path)
+    load_seconds = time.perf_counter() - start
+    analyze(corpus[0])  # warm-up
+
+    latencies = []
+    by_length = {}
+    chars = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for document in corpus:
+            doc_start = time.perf_counter()
+            analyze(document)
+            latency = (time.perf_counter() - doc_start) * 1000
+            latencies.append(latency)
+            chars += len(document["text"])
+            bucket = document["name"].split("-")[1] if document["name"].startswith("synthetic-") else "demo"
+            by_length.setdefault(bucket, []).append(latency)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    return {
+        "target": target,
+        "documents": len(latencies),
+        "load_seconds": load_seconds,
+        "model_rss_mb": peak_rss_mb() - rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "docs_per_sec": len(latencies) / elapsed,
+        "chars_per_sec": chars / elapsed,
+        "latency_ms_p50": percentile(latencies, 0.50),
+        "latency_ms_p95": percentile(latencies, 0.95),
+        "latency_ms_p99": percentile(latencies, 0.99),
+        "latency_ms_max": latencies[-1],
+        "latency_ms_p50_by_length": {bucket: percentile(sorted(values), 0.50) for bucket, values in by_length.items()},
+    }
+
+
+def run_in_subprocess(target, args):
+    env = dict(os.environ, IPSEE_MODEL_PATH=args.model)
+    if not args.cache:
+        env["IPSEE_CACHE_SIZE"] = "0"  # measure the model, not the result cache
+    return run_worker(__file__, target, ["--model", args.model, "--count", str(args.count), "--seed", str(args.seed),
+                                         "--repeats", str(args.repeats)], env=env, cwd=BACKEND_DIR)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Print the change of each target against an earlier report
+def compare(report, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"Compared with {baseline_path} (commit {baseline.get('commit')}):")
+    for target, result in report["targets"].items():
+        before = baseline.get("targets", {}).get(target)
+        if before is None:
+            continue
+        for metric in ("docs_per_sec", "latency_ms_p95", "peak_rss_mb"):
+            change = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+            print(f"  {target:>5} {metric}: {before[metric]:.2f} -> {result[metric]:.2f} ({change:+.1f}%)")
+
+
+# Offline benchmark of the analysis paths, replacing the scripts that POST to production:
+#   python bench_analyze.py --output bench_$(git rev-parse --short HEAD).json --baseline bench_previous.json
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput, latency and RSS of /analyze and the rule-based analyzer")
+    parser.add_argument("--model", default=os.path.abspath(os.path.join(BACKEND_DIR, "ipsee_ner_model")))
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--count", type=int, default=100, help="synthetic documents besides the demo texts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--cache", action="store_true", help="keep the /analyze result cache enabled")
+    parser.add_argument("--output", default="bench_analyze_report.json")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--worker", choices=TARGETS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.model, args.count, args.seed, args.repeats)))
+        sys.exit(0)
+
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"model": args.model, "count": args.count, "seed": args.seed, "repeats": args.repeats,
+                   "cache": args.cache},
+        "targets": {target: run_in_subprocess(target, args) for target in args.targets},
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+
+    for result in report["targets"].values():
+        print(f"{result['target']:>5}: {result['docs_per_sec']:.1f} docs/s {result['chars_per_sec']:.0f} chars/s "
+              f"p50={result['latency_ms_p50']:.2f}ms p95={result['latency_ms_p95']:.2f}ms "
+              f"p99={result['latency_ms_p99']:.2f}ms peak_rss={result['peak_rss_mb']:.1f}MB")
+    if args.baseline:
+        compare(report, args.baseline)
+    print(f"Report saved to {args.output}")
@@ -0,0 +1,26 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+
+
+# Peak resident set size of this process in MB (ru_maxrss is in KB on Linux)
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Value at quantile `q` of an already sorted list, or None when it is empty
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+# Run a benchmark script again as `script <args> --worker <worker>` and return the JSON result
+# it prints on its last line. Every measurement gets its own process, so model loading and
+# RSS numbers do not mix between them.
+def run_worker(script, worker, args, env=None, cwd=None):
+    output = subprocess.check_output([sys.executable, os.path.abspath(script), *args, "--worker", worker],
+                                     env=env, cwd=cwd)
+    return json.loads(output.decode().strip().splitlines()[-1])
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from bench_common import peak_rss_mb, percentile, run_worker
+from demo_corpus import DEMO_TOS
+
+# The serving loader lives in the backend
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+
+# Measure one loading mode (run through run_worker, in its own process)
+def measure(model_path, mode, repeats):
+    import spacy
+    from serving_model import load_serving_model
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    nlp = spacy.load(model_path) if mode == "full" else load_serving_model(model_path)
+    load_seconds = time.perf_counter() - start
+    rss_loaded = peak_rss_mb()
+
+    texts = list(DEMO_TOS.values())
+    nlp(texts[0])  # warm-up
+
+    latencies = []
+    entities = []
+    for _ in range(repeats):
+        for text in texts:
+            start = time.perf_counter()
+            doc = nlp(text)
+            latencies.append((time.perf_counter() - start) * 1000)
+            entities.append([(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents])
+    latencies.sort()
+
+    return {
+        "mode": mode,
+        "pipeline": nlp.pipe_names,
+        "load_seconds": load_seconds,
+        "model_rss_mb": rss_loaded - rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "latency_ms_mean": statistics.mean(latencies),
+        "latency_ms_p50": percentile(latencies, 0.50),
+        "latency_ms_p95": percentile(latencies, 0.95),
+        "entities": entities[:len(texts)],
+    }
+
+
+def run_in_subprocess(model_path, mode, repeats):
+    return run_worker(__file__, mode, ["--model", model_path, "--repeats", str(repeats)])
+
+
+# Compare the full pipeline against the NER-only serving pipeline:
+#   python bench_serving_model.py --model ../../backend/ipsee_ner_model
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency and RSS of the full vs NER-only pipeline")
+    parser.add_argument("--model", default="./ipsee_ner_model")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--output", default="serving_model_report.json")
+    parser.add_argument("--worker", choices=["full", "ner"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.model, args.worker, args.repeats)))
+        sys.exit(0)
+
+    full = run_in_subprocess(args.model, "full", args.repeats)
+    trimmed = run_in_subprocess(args.model, "ner", args.repeats)
+    # With no entities on either side the comparison proves nothing (e.g. an untrained model)
+    if not any(full["entities"]) and not any(trimmed["entities"]):
+        sys.exit(f"Neither pipeline found any entity in the demo texts; is {args.model} the trained NER model?")
+
+    report = {
+        "model": args.model,
+        "full": full,
+        "ner": trimmed,
+        "same_entities": full["entities"] == trimmed["entities"],
+        "latency_speedup": full["latency_ms_mean"] / trimmed["latency_ms_mean"],
+        "rss_saved_mb": full["peak_rss_mb"] - trimmed["peak_rss_mb"],
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+
+    for result in (full, trimmed):
+        print(f"{result['mode']:>5}: pipeline={result['pipeline']} load={result['load_seconds']:.2f}s "
+              f"peak_rss={result['peak_rss_mb']:.1f}MB p50={result['latency_ms_p50']:.2f}ms "
+              f"p95={result['latency_ms_p95']:.2f}ms")
+    print(f"Speedup: {report['latency_speedup']:.2f}x, RSS saved: {report['rss_saved_mb']:.1f}MB, "
+          f"identical entities: {report['same_entities']}")
+    print(f"Report saved to {args.output}")
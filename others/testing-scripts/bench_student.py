@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from bench_common import peak_rss_mb, run_worker
+
+# The serving loader lives in the backend
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+LABELS = ["VIOLATION", "ESSENTIAL_COOKIE", "MISLEADING_OPTION"]
+
+
+# Evaluation set: JSONL with {"text", "entities": [[start, end, label], ...]} per line, e.g. a
+# hand-labelled gold set or heldout_teacher_labels.jsonl from distill_student.py
+def load_eval_set(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [(record["text"], {tuple(ent) for ent in record["entities"]}) for record in records]
+
+
+# Exact-span precision / recall / F1 per label
+def score(gold_sets, predicted_sets):
+    counts = {}
+    for gold, predicted in zip(gold_sets, predicted_sets):
+        for label in {ent[2] for ent in gold | predicted}:
+            label_counts = counts.setdefault(label, Counter())
+            gold_label = {ent for ent in gold if ent[2] == label}
+            predicted_label = {ent for ent in predicted if ent[2] == label}
+            label_counts["tp"] += len(gold_label & predicted_label)
+            label_counts["fp"] += len(predicted_label - gold_label)
+            label_counts["fn"] += len(gold_label - predicted_label)
+
+    scores = {}
+    for label in LABELS + sorted(set(counts) - set(LABELS)):
+        label_counts = counts.get(label, Counter())
+        precision = label_counts["tp"] / (label_counts["tp"] + label_counts["fp"]) if label_counts["tp"] + label_counts["fp"] else 0.0
+        recall = label_counts["tp"] / (label_counts["tp"] + label_counts["fn"]) if label_counts["tp"] + label_counts["fn"] else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        scores[label] = {"p": precision, "r": recall, "f": f1, "support": label_counts["tp"] + label_counts["fn"]}
+    return scores
+
+
+# Measure one model (run through run_worker, in its own process)
+def measure(model_path, eval_path, batch_size):
+    from serving_model import load_serving_model
+
+    eval_set = load_eval_set(eval_path)
+    texts = [text for text, _ in eval_set]
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    nlp = load_serving_model(model_path)
+    load_seconds = time.perf_counter() - start
+    rss_loaded = peak_rss_mb()
+    nlp(texts[0])  # warm-up
+
+    start = time.perf_counter()
+    docs = list(nlp.pipe(texts, batch_size=batch_size))
+    elapsed = time.perf_counter() - start
+    predicted = [{(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents} for doc in docs]
+
+    return {
+        "model": model_path,
+        "format": nlp.meta.get("format", "spacy"),
+        "load_seconds": load_seconds,
+        "model_rss_mb": rss_loaded - rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "docs_per_sec": len(texts) / elapsed,
+        "chars_per_sec": sum(len(text) for text in texts) / elapsed,
+        "per_label": score([gold for _, gold in eval_set], predicted),
+    }
+
+
+def run_in_subprocess(model_path, args):
+    return run_worker(__file__, model_path, ["--eval", args.eval, "--batch-size", str(args.batch_size)])
+
+
+# Compare teacher and students on the same evaluation set:
+#   python bench_student.py --eval heldout_teacher_labels.jsonl \
+#       --models teacher=./ipsee_ner_model student=./ipsee_ner_student onnx=./ipsee_ner_student_onnx
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-label F1, throughput and memory of teacher vs student models")
+    parser.add_argument("--models", nargs="+", default=[], metavar="NAME=PATH")
+    parser.add_argument("--eval", required=True)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--output", default="student_report.json")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.eval, args.batch_size)))
+        sys.exit(0)
+
+    results = {}
+    for spec in args.models:
+        name, _, path = spec.partition("=")
+        results[name] = run_in_subprocess(path, args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({"eval": args.eval, "models": results}, f, indent=4)
+
+    for name, result in results.items():
+        f_scores = " ".join(f"{label}={scores['f']:.3f}" for label, scores in result["per_label"].items())
+        print(f"{name:>10}: {result['docs_per_sec']:.1f} docs/s peak_rss={result['peak_rss_mb']:.1f}MB "
+              f"load={result['load_seconds']:.2f}s F1 {f_scores}")
+    print(f"Report saved to {args.output}")
@@ -0,0 +1,105 @@
+import random
+
+# TOS texts from the demo sites, shared by the benchmark and load-testing scripts
+DEMO_TOS = {
+    "demo1": """
+We use cookies to ensure the proper functioning of our website. By accepting, you agree to our Terms of Service.
+
+Terms of Service:
+By using this website, you agree to our use of cookies for essential website functionality only. No personal data is collected for marketing or advertising purposes.
+Essential cookies are required for the basic functionality of the website, such as session management and login functions. No tracking or advertising cookies are used.
+We value your privacy and ensure that no personal data is shared with third parties.
+If you do not agree with these terms, please do not use this website. Continued use of this site signifies your agreement to these terms.
+""",
+
+    "demo2": """
+We use cookies to enhance your browsing experience and share data with third-party partners. By continuing, you agree to our Terms of Service.
+
+Realistic TOS for Personal Data Collection:
+This website uses cookies to track your behavior and collect personal data such as your IP address, location data, browsing history, and personal preferences.
+We share this data with third-party advertising networks, marketing agencies, and social media platforms for the purpose of targeted advertising. This data may also be used to create user profiles and deliver personalized ads across multiple websites.
+Some cookies are essential for website functionality, but others are used to collect information for performance analysis and marketing campaigns. These non-essential cookies are shared with third parties, and your personal data may be stored outside the European Economic Area (EEA), which could be in violation of GDPR.
+By accepting all cookies, you agree to share your personal information with third-party partners and permit cross-site tracking. You also consent to the possibility of data transfer to non-GDPR-compliant regions.
+If you do not wish to share your personal data, you can choose to reject all non-essential cookies. However, essential cookies necessary for website functionality cannot be disabled.
+""",
+
+    "demo3": """
+This website requires essential cookies for core functionality. By continuing, you agree to our Terms of Service.
+
+Terms of Service:
+This website uses essential cookies that are strictly necessary for the operation of our services. These include cookies related to session management, authentication, and secure browsing, which allow you to navigate the website and use its features.
+Without these essential cookies, certain parts of the website may not function correctly, such as logging in, maintaining your session, or completing transactions.
+By accepting essential cookies, you enable core functionalities such as the ability to log in, access secure areas, and use personalized settings. Essential cookies do not track your browsing behavior for marketing purposes.
+""",
+
+    "demo4": """
+We use cookies to collect personal information such as your browsing history, location, and preferences. By clicking "Accept All", you consent to all data collection activities. Learn more in our Terms of Service.
+
+Terms of Service:
+Data Collection & Personal Information:
+By accepting all cookies, you agree to allow this website to collect personal data, including:
+    - Your browsing history
+    - Your IP address and location
+    - Your personal preferences and interests
+    - Data shared with third-party advertisers
+
+We may also share this information with third-party partners for marketing, advertising, and analysis purposes.
+This data may be retained for extended periods and used to build a profile for personalized advertising.
+""",
+}
+
+# Cookie options shown on each demo page (demo3/demo4 as the extension sends them)
+DEMO_OPTIONS = {
+    "demo1": "Accept Essential Cookies",
+    "demo2": "Accept All Cookies | Reject All Cookies",
+    "demo3": "Accept All Cookies | Accept Essential Cookies | Reject All Cookies",
+    "demo4": "Accept All Cookies",
+}
+
+# Extra policy sentences mixed into the synthetic corpus alongside the demo lines
+SYNTHETIC_SENTENCES = [
+    "You have the right to access, rectify or request deletion of your personal data at any time.",
+    "We retain personal information for as long as your account is active or as required by law.",
+    "Analytics cookies help us understand how visitors interact with the website.",
+    "You may withdraw consent or manage preferences in the privacy settings at any time.",
+    "Our data processors are bound by contractual obligations to protect your information.",
+    "This policy was last updated on the effective date shown at the top of this page.",
+    "By continuing to browse, we assume your consent to the use of all cookies.",
+    "We may sell your data to third-party partners for marketing purposes.",
+    "Cookie expiration varies from the end of the session to two years.",
+    "Only accept all is offered; declining cookies may limit access to the service.",
+]
+
+SYNTHETIC_OPTIONS = list(DEMO_OPTIONS.values()) + ["", "Manage Preferences | Accept All Cookies"]
+
+
+# Deterministic synthetic TOS documents of varied lengths, built from the demo sentences and
+# SYNTHETIC_SENTENCES. Each document is {"name", "text", "options"}; the same seed always
+# gives the same corpus so runs on different commits are comparable.
+def synthetic_corpus(count=100, lengths=(300, 1500, 6000, 25000), seed=0):
+    rng = random.Random(seed)
+    pool = [line.strip() for text in DEMO_TOS.values() for line in text.splitlines() if len(line.strip()) > 20]
+    pool += SYNTHETIC_SENTENCES
+
+    corpus = []
+    for i in range(count):
+        target = lengths[i % len(lengths)]
+        sentences = []
+        size = 0
+        while size < target:
+            sentence = rng.choice(pool)
+            sentences.append(sentence)
+            size += len(sentence) + 1
+            if rng.random() < 0.2:
+                sentences.append("\n")
+        corpus.append({
+            "name": f"synthetic-{target}-{i}",
+            "text": " ".join(sentences),
+            "options": rng.choice(SYNTHETIC_OPTIONS),
+        })
+    return corpus
+
+
+# The demo documents in the same shape as synthetic_corpus()
+def demo_documents():
+    return [{"name": name, "text": text, "options": DEMO_OPTIONS[name]} for name, text in DEMO_TOS.items()]
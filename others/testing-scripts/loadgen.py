@@ -0,0 +1,258 @@
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from bench_common import percentile
+from demo_corpus import demo_documents, synthetic_corpus
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+# Payloads in the shape the extension sends to /api/report. A recorded corpus is a JSONL
+# file with one {"url", "txtTos", "options"} object per line.
+def load_payloads(corpus_path=None, count=100, seed=0):
+    if corpus_path:
+        with open(corpus_path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    documents = demo_documents() + synthetic_corpus(count=count, seed=seed)
+    return [{"url": f"https://demo.ip-see.com/{document['name']}", "txtTos": document["text"],
+             "options": document["options"]} for document in documents]
+
+
+# /api/report takes the payload as is; /analyze takes the fields the Node tier forwards
+def request_body(payload, target):
+    if target == "report":
+        return payload
+    return {"tos_text": payload["txtTos"], "options": payload["options"]}
+
+
+# Stand-in for the Node /api/report route (routes/report.js): forwards to the Flask /analyze
+# endpoint and answers in the same shape, keeping flagged reports in memory instead of MongoDB
+def start_report_stub(port, analyze_url):
+    session = requests.Session()
+    lock = threading.Lock()
+    stored = Counter()
+
+    class ReportHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip('/') != '/api/report':
+                return self._reply(404, {"error": "not found"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                response = session.post(analyze_url, json=request_body(body, "analyze"), timeout=60)
+                response.raise_for_status()
+                data = response.json()
+            except Exception:
+                return self._reply(500, {"error": "Error analyzing TOS"})
+
+            flagged = not data["compliant"] or len(data["violations"]) > 0 or data["essentialCookiesRequired"]
+            if flagged:
+                with lock:
+                    stored[body.get("url")] += 1
+            self._reply(200, {
+                "compliant": data["compliant"],
+                "violations": data["violations"],
+                "essentialCookiesRequired": data["essentialCookiesRequired"],
+                "cookieOptions": data["cookieOptions"],
+                "flagged": flagged,
+            })
+
+        def _reply(self, status, body):
+            encoded = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def log_message(self, format, *args):
+            pass  # one line per request would drown the report
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), ReportHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.stored_reports = stored
+    return server
+
+
+# Requests share one connection pool per thread
+_local = threading.local()
+
+
+def send(url, body, timeout):
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    try:
+        response = _local.session.post(url, json=body, timeout=timeout)
+        return str(response.status_code)
+    except requests.Timeout:
+        return "timeout"
+    except requests.RequestException as e:
+        return type(e).__name__
+
+
+# One sample per request: (seconds since the run started, latency in ms, outcome)
+class Recorder:
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def record(self, started_at, latency_ms, outcome):
+        with self._lock:
+            self.samples.append((started_at, latency_ms, outcome))
+
+
+# Open loop: requests are issued on a fixed schedule whatever the response times are.
+# Latency is measured from the scheduled send time, so queueing in the generator itself
+# (when all `max_inflight` threads are busy) shows up as latency instead of being hidden.
+def run_open_loop(url, bodies, rps, duration, timeout, max_inflight, recorder):
+    run_start = time.perf_counter()
+    total = int(rps * duration)
+
+    def fire(scheduled, body):
+        outcome = send(url, body, timeout)
+        recorder.record(scheduled - run_start, (time.perf_counter() - scheduled) * 1000, outcome)
+
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        for i in range(total):
+            scheduled = run_start + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, scheduled, bodies[i % len(bodies)])
+    return time.perf_counter() - run_start
+
+
+# Closed loop: `concurrency` clients each send their next request as soon as the previous
+# one is answered
+def run_closed_loop(url, bodies, concurrency, duration, timeout, recorder):
+    run_start = time.perf_counter()
+    deadline = run_start + duration
+    counter = iter(range(1 << 62))
+    counter_lock = threading.Lock()
+
+    def client():
+        while time.perf_counter() < deadline:
+            with counter_lock:
+                i = next(counter)
+            started = time.perf_counter()
+            outcome = send(url, bodies[i % len(bodies)], timeout)
+            recorder.record(started - run_start, (time.perf_counter() - started) * 1000, outcome)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - run_start
+
+
+def histogram(latencies):
+    counts = Counter()
+    for latency in latencies:
+        bucket = next((f"<={bound}ms" for bound in HISTOGRAM_BUCKETS_MS if latency <= bound),
+                      f">{HISTOGRAM_BUCKETS_MS[-1]}ms")
+        counts[bucket] += 1
+    order = [f"<={bound}ms" for bound in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+    return {bucket: counts[bucket] for bucket in order if counts[bucket]}
+
+
+# Latency histogram, error rates and per-second throughput of a finished run
+def summarize(samples, elapsed, interval=1.0):
+    latencies = sorted(latency for _, latency, _ in samples)
+    outcomes = Counter(outcome for _, _, outcome in samples)
+    errors = sum(count for outcome, count in outcomes.items() if outcome != "200")
+
+    timeline = {}
+    for started_at, latency, outcome in samples:
+        window = timeline.setdefault(int(started_at // interval), {"latencies": [], "errors": 0})
+        window["latencies"].append(latency)
+        window["errors"] += outcome != "200"
+    over_time = []
+    for index in sorted(timeline):
+        window_latencies = sorted(timeline[index]["latencies"])
+        over_time.append({
+            "t": index * interval,
+            "throughput_rps": len(window_latencies) / interval,
+            "errors": timeline[index]["errors"],
+            "latency_ms_p50": percentile(window_latencies, 0.50),
+            "latency_ms_p95": percentile(window_latencies, 0.95),
+        })
+
+    return {
+        "requests": len(samples),
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "outcomes": dict(outcomes),
+        "latency_ms_p50": percentile(latencies, 0.50),
+        "latency_ms_p95": percentile(latencies, 0.95),
+        "latency_ms_p99": percentile(latencies, 0.99),
+        "latency_ms_max": latencies[-1] if latencies else None,
+        "histogram": histogram(latencies),
+        "over_time": over_time,
+    }
+
+
+# Load-test a local instance, e.g.
+#   open loop at 50 req/s against Flask:  python loadgen.py --rps 50 --duration 60
+#   64 clients through the Node tier:     python loadgen.py --target report --url http://localhost:3000/api/report --concurrency 64
+#   Flask alone behind the report stub:   python loadgen.py --stub-report 3001 --concurrency 16
+# Step --rps up across runs; saturation is where throughput stops following it and p95 climbs.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open/closed-loop load generator for the analyze service")
+    parser.add_argument("--target", choices=["analyze", "report"], default="analyze",
+                        help="payload shape: Flask /analyze or Node /api/report")
+    parser.add_argument("--url", help="endpoint to load (default depends on --target)")
+    parser.add_argument("--corpus", help="recorded JSONL payloads ({url, txtTos, options} per line)")
+    parser.add_argument("--count", type=int, default=100, help="synthetic payloads when no corpus is given")
+    parser.add_argument("--seed", type=int, default=0)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--rps", type=float, help="open loop at this request rate")
+    mode.add_argument("--concurrency", type=int, help="closed loop with this many clients (default 8)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--max-inflight", type=int, default=256, help="open loop: concurrent requests cap")
+    parser.add_argument("--stub-report", type=int, metavar="PORT",
+                        help="serve a local /api/report stub on PORT (no Node/MongoDB) and load it")
+    parser.add_argument("--analyze-url", default="http://localhost:5000/analyze", help="where the stub forwards to")
+    parser.add_argument("--output", default="loadgen_report.json")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub_report:
+        stub = start_report_stub(args.stub_report, args.analyze_url)
+        args.target = "report"
+        args.url = f"http://127.0.0.1:{args.stub_report}/api/report"
+    url = args.url or ("http://localhost:3000/api/report" if args.target == "report" else args.analyze_url)
+
+    bodies = [request_body(payload, args.target) for payload in load_payloads(args.corpus, args.count, args.seed)]
+    recorder = Recorder()
+    if args.rps:
+        config = {"mode": "open", "rps": args.rps}
+        elapsed = run_open_loop(url, bodies, args.rps, args.duration, args.timeout, args.max_inflight, recorder)
+    else:
+        config = {"mode": "closed", "concurrency": args.concurrency or 8}
+        elapsed = run_closed_loop(url, bodies, config["concurrency"], args.duration, args.timeout, recorder)
+
+    report = {"url": url, "target": args.target, "payloads": len(bodies), "duration": args.duration, **config,
+              **summarize(recorder.samples, elapsed)}
+    if stub is not None:
+        report["stub_flagged_reports"] = sum(stub.stored_reports.values())
+        stub.shutdown()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+
+    print(f"{report['requests']} requests in {elapsed:.1f}s: {report['throughput_rps']:.1f} req/s, "
+          f"error rate {report['error_rate']:.2%}, p50={report['latency_ms_p50'] or 0:.1f}ms "
+          f"p95={report['latency_ms_p95'] or 0:.1f}ms p99={report['latency_ms_p99'] or 0:.1f}ms")
+    for bucket, count in report["histogram"].items():
+        print(f"  {bucket:>10} {count}")
+    print(f"Report saved to {args.output}")
@@ -0,0 +1,176 @@
+import copy
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import torch
+from torch import nn
+
+from corpus_cache import iter_docs
+
+# Label id for tokens that do not contribute to the loss (special tokens, unannotated docs)
+IGNORE_INDEX = -100
+
+
+# BIO tag set for the entity labels, "O" first
+def bio_tags(entity_labels):
+    return ["O"] + [f"{prefix}-{label}" for label in sorted(entity_labels) for prefix in ("B", "I")]
+
+
+# Split a document into windows of at most `max_length` word pieces and tag each piece from
+# the character spans of the document's entities. Unannotated documents get IGNORE_INDEX.
+def encode_document(tokenizer, text, spans, annotated, tag_ids, max_length):
+    encoding = tokenizer(text, truncation=True, max_length=max_length, return_overflowing_tokens=True,
+                         return_offsets_mapping=True, return_special_tokens_mask=True)
+    windows = []
+    for input_ids, offsets, special in zip(encoding["input_ids"], encoding["offset_mapping"],
+                                           encoding["special_tokens_mask"]):
+        tags = []
+        previous = None
+        for (start, end), is_special in zip(offsets, special):
+            if is_special or not annotated:
+                tags.append(IGNORE_INDEX)
+                continue
+            label = next((span_label for span_start, span_end, span_label in spans
+                          if start < span_end and end > span_start), None)
+            if label is None:
+                tags.append(tag_ids["O"])
+            else:
+                tags.append(tag_ids[f"{'I' if previous == label else 'B'}-{label}"])
+            previous = label
+        windows.append((input_ids, tags))
+    return windows
+
+
+# (batch, 1, 1, seq) mask added to the attention scores: 0 for tokens, a large negative for padding
+def additive_mask(attention_mask, dtype):
+    return (1.0 - attention_mask[:, None, None, :].to(dtype)) * torch.finfo(dtype).min
+
+
+# Run encoder layers directly (older transformers versions return a tuple per layer)
+def run_layers(layers, hidden, attention_mask):
+    mask = additive_mask(attention_mask, hidden.dtype)
+    for layer in layers:
+        output = layer(hidden, attention_mask=mask)
+        hidden = output[0] if isinstance(output, tuple) else output
+    return hidden
+
+
+# Hidden states after the first `n_layers` encoder layers (the frozen prefix) of a BERT-style model
+def frozen_prefix(model, input_ids, attention_mask, n_layers):
+    hidden = model.embeddings(input_ids=input_ids)
+    return run_layers(model.encoder.layer[:n_layers], hidden, attention_mask)
+
+
+def cache_name(model_name, frozen_layers, max_length, dtype):
+    return f"activations-{model_name.replace('/', '_')}-{frozen_layers}-{max_length}-{np.dtype(dtype).name}"
+
+
+# Run the frozen prefix once per window of every corpus document and store the hidden states
+# in a memory-mapped (tokens x hidden) .npy array, with the BIO tags of each token alongside.
+# index.json lists (document position, first row, length) for every window.
+def build_activation_cache(model, tokenizer, nlp, corpus_dir, cache_dir, frozen_layers,
+                           max_length=512, dtype=np.float16, batch_size=8):
+    docs = list(iter_docs(nlp, corpus_dir))
+    entity_labels = sorted({ent.label_ for _, doc in docs for ent in doc.ents})
+    tags = bio_tags(entity_labels)
+    tag_ids = {tag: i for i, tag in enumerate(tags)}
+
+    # First pass: word pieces only, to size the arrays
+    windows = []
+    for position, doc in docs:
+        spans = [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]
+        for input_ids, window_tags in encode_document(tokenizer, doc.text, spans, doc.has_annotation("ENT_IOB"),
+                                                      tag_ids, max_length):
+            windows.append((position, input_ids, window_tags))
+    total_rows = sum(len(input_ids) for _, input_ids, _ in windows)
+
+    tmp_dir = cache_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    hidden_size = model.config.hidden_size
+    hidden_store = np.lib.format.open_memmap(os.path.join(tmp_dir, "hidden.npy"), mode='w+',
+                                             dtype=dtype, shape=(total_rows, hidden_size))
+    tag_store = np.lib.format.open_memmap(os.path.join(tmp_dir, "tags.npy"), mode='w+',
+                                          dtype=np.int16, shape=(total_rows,))
+
+    # Second pass: the frozen layers, batched over windows sorted by length to limit padding
+    sequences = [None] * len(windows)
+    row = 0
+    for i, (position, input_ids, _) in enumerate(windows):
+        sequences[i] = (position, row, len(input_ids))
+        row += len(input_ids)
+    order = sorted(range(len(windows)), key=lambda i: len(windows[i][1]))
+    device = next(model.parameters()).device
+    model.eval()
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            width = max(len(windows[i][1]) for i in batch)
+            input_ids = torch.zeros((len(batch), width), dtype=torch.long)
+            attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+            for j, i in enumerate(batch):
+                ids = windows[i][1]
+                input_ids[j, :len(ids)] = torch.tensor(ids)
+                attention_mask[j, :len(ids)] = 1
+            hidden = frozen_prefix(model, input_ids.to(device), attention_mask.to(device), frozen_layers)
+            hidden = hidden.float().cpu().numpy()
+            for j, i in enumerate(batch):
+                _, first_row, length = sequences[i]
+                hidden_store[first_row:first_row + length] = hidden[j, :length]
+                tag_store[first_row:first_row + length] = windows[i][2]
+
+    hidden_store.flush()
+    tag_store.flush()
+    del hidden_store, tag_store
+    with open(os.path.join(tmp_dir, "index.json"), 'w', encoding='utf-8') as f:
+        json.dump({"tags": tags, "frozen_layers": frozen_layers, "max_length": max_length,
+                   "hidden_size": hidden_size, "dtype": np.dtype(dtype).name, "sequences": sequences}, f)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.rename(tmp_dir, cache_dir)
+    logging.info(f"Cached {total_rows} token activations of {len(windows)} windows in {cache_dir}")
+
+
+# Read-only view of a built cache; the arrays are memory-mapped, not loaded
+class ActivationCache:
+    def __init__(self, cache_dir):
+        with open(os.path.join(cache_dir, "index.json"), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.tags = index["tags"]
+        self.frozen_layers = index["frozen_layers"]
+        self.sequences = index["sequences"]
+        self.hidden = np.load(os.path.join(cache_dir, "hidden.npy"), mmap_mode='r')
+        self.tag_ids = np.load(os.path.join(cache_dir, "tags.npy"), mmap_mode='r')
+
+    # Windows belonging to the given corpus document positions
+    def windows_for(self, positions):
+        return [i for i, (position, _, _) in enumerate(self.sequences) if position in positions]
+
+    # Padded (hidden, attention mask, tags) tensors for a list of windows
+    def batch(self, windows, device="cpu"):
+        width = max(self.sequences[i][2] for i in windows)
+        hidden = torch.zeros((len(windows), width, self.hidden.shape[1]), dtype=torch.float32)
+        attention_mask = torch.zeros((len(windows), width), dtype=torch.long)
+        tags = torch.full((len(windows), width), IGNORE_INDEX, dtype=torch.long)
+        for j, i in enumerate(windows):
+            _, first_row, length = self.sequences[i]
+            hidden[j, :length] = torch.from_numpy(np.asarray(self.hidden[first_row:first_row + length], dtype=np.float32))
+            attention_mask[j, :length] = 1
+            tags[j, :length] = torch.from_numpy(np.asarray(self.tag_ids[first_row:first_row + length], dtype=np.int64))
+        return hidden.to(device), attention_mask.to(device), tags.to(device)
+
+
+# The trainable top of the encoder (copies of the unfrozen layers) plus a token
+# classification head, fed with cached frozen-prefix activations
+class TopLayersTagger(nn.Module):
+    def __init__(self, model, frozen_layers, num_tags, dropout=0.1):
+        super().__init__()
+        self.layers = nn.ModuleList(copy.deepcopy(layer) for layer in model.encoder.layer[frozen_layers:])
+        self.dropout = nn.Dropout(dropout)
+        self.classifier = nn.Linear(model.config.hidden_size, num_tags)
+
+    def forward(self, hidden, attention_mask):
+        hidden = run_layers(self.layers, hidden, attention_mask)
+        return self.classifier(self.dropout(hidden))
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import spacy
+from spacy.tokens import Doc, DocBin
+from spacy.training import Example
+from spacy.util import filter_spans
+
+# Preprocessed corpora are kept here, one directory per content hash
+CORPUS_CACHE_DIR = "./corpus_cache"
+
+# Documents per DocBin shard
+DOCS_PER_SHARD = 1000
+
+
+# Identifies the corpus and everything that affects its tokenization, so a changed text,
+# annotation, tokenizer or spaCy version gives a new directory instead of a stale one
+def corpus_hash(nlp, training_data):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([spacy.__version__, nlp.lang, nlp.meta.get("name"), nlp.meta.get("version")]).encode())
+    for text, annotations in training_data:
+        digest.update(json.dumps([text, annotations], sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+# Tokenize a text and attach its entity spans. Only the tokenizer is needed to align
+# character offsets with tokens; spans that do not fall on token boundaries are dropped.
+# Without an "entities" key the NER annotation stays missing rather than all-"O".
+def make_reference_doc(nlp, text, annotations):
+    doc = nlp.make_doc(text)
+    if "entities" not in annotations:
+        return doc
+    spans = []
+    for start, end, label in annotations["entities"]:
+        span = doc.char_span(start, end, label=label)
+        if span is None:
+            logging.warning(f"Entity ({start}, {end}, {label}) does not align with tokens, skipping")
+        else:
+            spans.append(span)
+    doc.ents = filter_spans(spans)
+    return doc
+
+
+# Align the spans once and write the corpus as DocBin shards plus a manifest. The shards
+# are written to a temporary directory that is renamed into place when complete.
+def build_corpus(nlp, training_data, corpus_dir, docs_per_shard=DOCS_PER_SHARD):
+    tmp_dir = corpus_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    shards = []
+    labels = set()
+    count = 0
+    doc_bin = DocBin(store_user_data=False)
+
+    def flush():
+        name = f"shard-{len(shards):05d}.spacy"
+        doc_bin.to_disk(os.path.join(tmp_dir, name))
+        shards.append(name)
+
+    for text, annotations in training_data:
+        doc = make_reference_doc(nlp, text, annotations)
+        labels.update(ent.label_ for ent in doc.ents)
+        doc_bin.add(doc)
+        count += 1
+        if len(doc_bin) >= docs_per_shard:
+            flush()
+            doc_bin = DocBin(store_user_data=False)
+    if len(doc_bin) or not shards:
+        flush()
+
+    manifest = {"hash": os.path.basename(corpus_dir), "docs": count, "docs_per_shard": docs_per_shard,
+                "shards": shards, "labels": sorted(labels)}
+    with open(os.path.join(tmp_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    os.rename(tmp_dir, corpus_dir)
+    return manifest
+
+
+# Directory of the preprocessed corpus, building it only when its content hash is new
+def load_or_build_corpus(nlp, training_data, cache_dir=CORPUS_CACHE_DIR):
+    training_data = list(training_data)
+    corpus_dir = os.path.join(cache_dir, corpus_hash(nlp, training_data))
+    if os.path.exists(os.path.join(corpus_dir, "manifest.json")):
+        logging.info(f"Using cached corpus {corpus_dir}")
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        manifest = build_corpus(nlp, training_data, corpus_dir)
+        logging.info(f"Built corpus {corpus_dir}: {manifest['docs']} docs in {len(manifest['shards'])} shards")
+    return corpus_dir
+
+
+def read_manifest(corpus_dir):
+    with open(os.path.join(corpus_dir, "manifest.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# (position in the corpus, reference doc) pairs, read one shard at a time. With `rng` the
+# shard order and the docs within each shard are shuffled, so only one shard is in memory.
+def iter_docs(nlp, corpus_dir, rng=None):
+    manifest = read_manifest(corpus_dir)
+    docs_per_shard = manifest.get("docs_per_shard", DOCS_PER_SHARD)
+    shards = list(enumerate(manifest["shards"]))
+    if rng is not None:
+        rng.shuffle(shards)
+    for shard_index, name in shards:
+        docs = DocBin().from_disk(os.path.join(corpus_dir, name)).get_docs(nlp.vocab)
+        positioned = ((shard_index * docs_per_shard + i, doc) for i, doc in enumerate(docs))
+        if rng is not None:
+            positioned = list(positioned)
+            rng.shuffle(positioned)
+        yield from positioned
+
+
+# Training examples, optionally only those whose position in the corpus is in `indices`.
+# The predicted side is rebuilt from the stored tokens, so the tokenizer does not run again.
+def iter_examples(nlp, corpus_dir, indices=None, rng=None):
+    for i, reference in iter_docs(nlp, corpus_dir, rng):
+        if indices is not None and i not in indices:
+            continue
+        predicted = Doc(nlp.vocab, words=[token.text for token in reference],
+                        spaces=[bool(token.whitespace_) for token in reference])
+        yield Example(predicted, reference)
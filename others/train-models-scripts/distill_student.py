@@ -0,0 +1,210 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+import spacy
+from thinc.api import compounding
+
+# The serving helpers live with the API that loads the model
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend"))
+from serving_model import load_serving_model, mark_for_serving
+from corpus_cache import load_or_build_corpus, read_manifest, iter_examples
+from activation_cache import IGNORE_INDEX, bio_tags, encode_document
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(message)s')
+
+
+# Crawled TOS texts: JSONL(.gz) records with a "text" field, as written by infowar.py and
+# warc_executor.py
+def iter_corpus_texts(paths, limit=None):
+    count = 0
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                text = json.loads(line).get("text")
+                if text:
+                    yield text
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+
+
+# Silver training data: the teacher's entities for every text
+def label_with_teacher(teacher, texts, batch_size=16):
+    silver = []
+    start = time.perf_counter()
+    for doc in teacher.pipe(texts, batch_size=batch_size):
+        silver.append((doc.text, {"entities": [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]}))
+    logging.info(f"Teacher labelled {len(silver)} documents in {time.perf_counter() - start:.1f}s")
+    return silver
+
+
+def save_jsonl(records, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for text, annotations in records:
+            f.write(json.dumps({"text": text, "entities": annotations["entities"]}) + "\n")
+
+
+# Small CNN NER (spaCy's default tok2vec + ner) trained on the silver data with shuffled
+# compounding minibatches; the weights of the best dev F1 epoch are kept
+def train_spacy_student(silver_train, dev, max_epochs, patience, seed):
+    nlp = spacy.blank("en")
+    ner = nlp.add_pipe("ner")
+    for _, annotations in silver_train:
+        for _, _, label in annotations["entities"]:
+            ner.add_label(label)
+
+    corpus_dir = load_or_build_corpus(nlp, silver_train)
+    dev_dir = load_or_build_corpus(nlp, dev)
+    n_docs = read_manifest(corpus_dir)["docs"]
+    optimizer = nlp.initialize(lambda: iter_examples(nlp, corpus_dir))
+
+    rng = random.Random(seed)
+    best_f, best_epoch, best_weights = -1.0, 0, None
+    for epoch in range(1, max_epochs + 1):
+        start = time.perf_counter()
+        losses = {}
+        batches = spacy.util.minibatch(iter_examples(nlp, corpus_dir, rng=rng), size=compounding(4.0, 32.0, 1.001))
+        for batch in batches:
+            nlp.update(batch, sgd=optimizer, drop=0.2, losses=losses)
+        f_score = nlp.evaluate(list(iter_examples(nlp, dev_dir))).get("ents_f") or 0.0
+        print(f"Student epoch {epoch}: loss={losses.get('ner', 0.0):.2f} dev_f={f_score:.3f} "
+              f"({n_docs / (time.perf_counter() - start):.1f} docs/s)")
+        if f_score > best_f:
+            best_f, best_epoch, best_weights = f_score, epoch, nlp.to_bytes()
+        elif epoch - best_epoch >= patience:
+            break
+
+    if best_weights is not None:
+        nlp.from_bytes(best_weights)
+    print(f"Best student dev F1 (agreement with the teacher) {best_f:.3f} at epoch {best_epoch}")
+    return nlp
+
+
+# Transformer token classifier trained on BIO tags derived from the silver spans
+def train_transformer_student(silver_train, model_name, max_length, epochs, batch_size, learning_rate, seed):
+    import torch
+    from transformers import AutoModelForTokenClassification, AutoTokenizer
+
+    torch.manual_seed(seed)
+    labels = sorted({label for _, annotations in silver_train for _, _, label in annotations["entities"]})
+    tags = bio_tags(labels)
+    tag_ids = {tag: i for i, tag in enumerate(tags)}
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForTokenClassification.from_pretrained(
+        model_name, num_labels=len(tags), id2label=dict(enumerate(tags)), label2id=tag_ids,
+        ignore_mismatched_sizes=True)
+
+    windows = []
+    for text, annotations in silver_train:
+        windows.extend(encode_document(tokenizer, text, annotations["entities"], True, tag_ids, max_length))
+
+    optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate)
+    rng = random.Random(seed)
+    model.train()
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        rng.shuffle(windows)
+        total = 0.0
+        for offset in range(0, len(windows), batch_size):
+            batch = windows[offset:offset + batch_size]
+            width = max(len(input_ids) for input_ids, _ in batch)
+            input_ids = torch.zeros((len(batch), width), dtype=torch.long)
+            attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+            labels_tensor = torch.full((len(batch), width), IGNORE_INDEX, dtype=torch.long)
+            for row, (ids, window_tags) in enumerate(batch):
+                input_ids[row, :len(ids)] = torch.tensor(ids)
+                attention_mask[row, :len(ids)] = 1
+                labels_tensor[row, :len(ids)] = torch.tensor(window_tags)
+            loss = model(input_ids=input_ids, attention_mask=attention_mask, labels=labels_tensor).loss
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item()
+        print(f"Transformer student epoch {epoch}: loss={total:.3f} ({time.perf_counter() - start:.1f}s)")
+    model.eval()
+    return model, tokenizer, tags
+
+
+# Export the transformer student for nlp_api: ONNX graph, optional int8 dynamic quantization,
+# the fast tokenizer and a meta.json that load_serving_model() recognises
+def export_onnx(model, tokenizer, tags, output_dir, max_length, quantize, source_meta):
+    import torch
+
+    os.makedirs(output_dir, exist_ok=True)
+    onnx_path = os.path.join(output_dir, "model.onnx")
+    example = tokenizer("Essential cookies are required.", return_tensors="pt")
+    torch.onnx.export(
+        model, (example["input_ids"], example["attention_mask"]), onnx_path,
+        input_names=["input_ids", "attention_mask"], output_names=["logits"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                      "logits": {0: "batch", 1: "sequence"}},
+        opset_version=17, dynamo=False,
+    )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(onnx_path, os.path.join(output_dir, "model.int8.onnx"), weight_type=QuantType.QInt8)
+
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, "tokenizer.json"))
+    with open(os.path.join(output_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({"format": "onnx", "tags": tags, "max_length": max_length, **source_meta}, f, indent=2)
+
+
+# Distil the teacher into a CPU-friendly student:
+#   python distill_student.py --teacher ./ipsee_ner_model --corpus extracted/*.jsonl.gz
+#   python distill_student.py ... --transformer-student prajjwal1/bert-small --onnx-int8
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a small student NER from teacher labels")
+    parser.add_argument("--teacher", required=True, help="spaCy model directory of the teacher")
+    parser.add_argument("--corpus", nargs="+", required=True, help="crawled JSONL(.gz) files with a text field")
+    parser.add_argument("--limit", type=int, default=None, help="use at most this many documents")
+    parser.add_argument("--heldout-fraction", type=float, default=0.1)
+    parser.add_argument("--max-epochs", type=int, default=30)
+    parser.add_argument("--patience", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="./ipsee_ner_student", help="spaCy student directory")
+    parser.add_argument("--transformer-student", metavar="HF_MODEL",
+                        help="also train a transformer student from this checkpoint and export it to ONNX")
+    parser.add_argument("--transformer-epochs", type=int, default=3)
+    parser.add_argument("--transformer-batch-size", type=int, default=16)
+    parser.add_argument("--transformer-lr", type=float, default=5e-5)
+    parser.add_argument("--max-length", type=int, default=256, help="word pieces per window")
+    parser.add_argument("--onnx-output", default="./ipsee_ner_student_onnx")
+    parser.add_argument("--onnx-int8", action="store_true", help="write an int8 dynamically quantized model too")
+    args = parser.parse_args()
+    if args.max_epochs < 1:
+        parser.error("--max-epochs must be at least 1")
+
+    teacher = load_serving_model(args.teacher)
+    silver = label_with_teacher(teacher, iter_corpus_texts(args.corpus, args.limit))
+    del teacher
+
+    random.Random(args.seed).shuffle(silver)
+    n_heldout = max(1, int(len(silver) * args.heldout_fraction))
+    heldout, silver_train = silver[:n_heldout], silver[n_heldout:]
+    # Teacher-labelled held-out documents, for bench_student.py when no gold set is at hand
+    save_jsonl(heldout, "heldout_teacher_labels.jsonl")
+
+    student = train_spacy_student(silver_train, heldout, args.max_epochs, args.patience, args.seed)
+    student.meta["name"] = "ipsee_ner_student"
+    student.meta["distilled_from"] = args.teacher
+    mark_for_serving(student)
+    student.to_disk(args.output)
+    print(f"spaCy student saved to {args.output}")
+
+    if args.transformer_student:
+        model, tokenizer, tags = train_transformer_student(
+            silver_train, args.transformer_student, args.max_length, args.transformer_epochs,
+            args.transformer_batch_size, args.transformer_lr, args.seed)
+        export_onnx(model, tokenizer, tags, args.onnx_output, args.max_length, args.onnx_int8,
+                    {"name": "ipsee_ner_student_onnx", "version": "0.0.1", "base": args.transformer_student,
+                     "distilled_from": args.teacher})
+        print(f"ONNX student saved to {args.onnx_output} (serve it with IPSEE_MODEL_PATH={args.onnx_output})")
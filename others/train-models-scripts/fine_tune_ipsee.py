@@ -1,5 +1,40 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
 import spacy
-from spacy.training.example import Example
+from spacy.training import Example
+from thinc.api import compounding
+
+# The serving helpers live with the API that loads the model
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend"))
+from serving_model import mark_for_serving
+from corpus_cache import load_or_build_corpus, read_manifest, iter_examples
+
+# Labels scored on the dev split (any other label found in the data is scored too)
+TARGET_LABELS = ["VIOLATION", "ESSENTIAL_COOKIE", "MISLEADING_OPTION"]
+
+parser = argparse.ArgumentParser(description="Fine-tune the ipsee NER")
+parser.add_argument("--mode", choices=["per-example", "minibatch"], default="per-example",
+                    help="per-example: one update per example for a fixed number of iterations; "
+                         "minibatch: shuffled compounding minibatches with dev evaluation and early stopping")
+parser.add_argument("--data", nargs="*", default=[],
+                    help="extra JSONL(.gz) files of {text, entities: [[start, end, label], ...]} "
+                         "or WARC pipeline records with {text, annotations: [{start, end, label}, ...]}")
+parser.add_argument("--iterations", type=int, default=100, help="per-example mode")
+parser.add_argument("--max-epochs", type=int, default=50, help="minibatch mode")
+parser.add_argument("--patience", type=int, default=5, help="epochs without dev F1 improvement before stopping")
+parser.add_argument("--dev-fraction", type=float, default=0.2)
+parser.add_argument("--batch-start", type=float, default=4.0)
+parser.add_argument("--batch-stop", type=float, default=32.0)
+parser.add_argument("--batch-compound", type=float, default=1.001)
+parser.add_argument("--drop", type=float, default=0.25)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--output", default="./ipsee_ner_model")
+args = parser.parse_args()
 
 # Load the base spaCy model
 nlp = spacy.load("en_core_web_sm")
@@ -53,18 +88,24 @@ TRAIN_DATA = [
      {"entities": [(7, 19, "VIOLATION"), (38, 65, "VIOLATION")]}),
 ]
 
-# Helper function to align entity spans with tokens
-def calculate_correct_spans(nlp, training_data):
-    corrected_data = []
-    for text, annotations in training_data:
-        doc = nlp(text)
-        entities = []
-        for start, end, label in annotations["entities"]:
-            span = doc.char_span(start, end, label=label)
-            if span is not None:
-                entities.append((span.start_char, span.end_char, label))
-        corrected_data.append((text, {"entities": entities}))
-    return corrected_data
+# Annotated records produced outside this file (e.g. by the WARC extraction pipeline)
+def load_extra_data(paths):
+    extra = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "entities" in record:
+                    entities = [tuple(ent) for ent in record["entities"]]
+                else:
+                    entities = [(ent["start"], ent["end"], ent["label"]) for ent in record.get("annotations", [])]
+                extra.append((record["text"], {"entities": entities}))
+    return extra
+
+TRAIN_DATA = TRAIN_DATA + load_extra_data(args.data)
 
 # Get the NER component from the model
 ner = nlp.get_pipe("ner")
@@ -74,23 +115,74 @@ for _, annotations in TRAIN_DATA:
     for ent in annotations.get("entities"):
         ner.add_label(ent[2])
 
-# Align the entity spans with tokens
-TRAIN_DATA = calculate_correct_spans(nlp, TRAIN_DATA)
+# Align the entity spans with tokens once; later runs on the same data reuse the DocBin shards
+corpus_dir = load_or_build_corpus(nlp, TRAIN_DATA)
 
 # Disable other pipes and train only NER
 unaffected_pipes = [pipe for pipe in nlp.pipe_names if pipe != "ner"]
 
+# Precision / recall / F1 per label on the dev examples (predicted docs are made fresh each time)
+def evaluate(dev_examples):
+    scores = nlp.evaluate([Example(nlp.make_doc(eg.reference.text), eg.reference) for eg in dev_examples])
+    per_type = scores.get("ents_per_type") or {}
+    labels = TARGET_LABELS + sorted(set(per_type) - set(TARGET_LABELS))
+    return scores.get("ents_f") or 0.0, {label: per_type.get(label, {"p": 0.0, "r": 0.0, "f": 0.0}) for label in labels}
+
+# Shuffled, compounding-size minibatches over the train split; the NER weights of the best
+# dev F1 epoch are kept, and training stops after `patience` epochs without improvement
+def train_minibatch(optimizer):
+    rng = random.Random(args.seed)
+    positions = list(range(read_manifest(corpus_dir)["docs"]))
+    rng.shuffle(positions)
+    n_dev = max(1, int(len(positions) * args.dev_fraction))
+    dev_positions, train_positions = set(positions[:n_dev]), set(positions[n_dev:])
+    dev_examples = list(iter_examples(nlp, corpus_dir, dev_positions))
+    print(f"Training on {len(train_positions)} documents, evaluating on {len(dev_examples)}")
+
+    batch_sizes = compounding(args.batch_start, args.batch_stop, args.batch_compound)
+    best_f, best_epoch, best_weights = -1.0, 0, None
+    for epoch in range(1, args.max_epochs + 1):
+        start = time.perf_counter()
+        losses = {}
+        words = 0
+        examples = iter_examples(nlp, corpus_dir, train_positions, rng=rng)
+        for batch in spacy.util.minibatch(examples, size=batch_sizes):
+            nlp.update(batch, sgd=optimizer, drop=args.drop, losses=losses)
+            words += sum(len(example.reference) for example in batch)
+        train_seconds = time.perf_counter() - start
+        f_score, per_label = evaluate(dev_examples)
+
+        print(f"Epoch {epoch}: loss={losses.get('ner', 0.0):.2f} dev_f={f_score:.3f} "
+              f"time={train_seconds:.1f}s ({words / train_seconds:.0f} words/s)")
+        for label, label_scores in per_label.items():
+            print(f"    {label:<18} p={label_scores['p']:.3f} r={label_scores['r']:.3f} f={label_scores['f']:.3f}")
+
+        if f_score > best_f:
+            best_f, best_epoch, best_weights = f_score, epoch, ner.to_bytes()
+        elif epoch - best_epoch >= args.patience:
+            print(f"Early stopping: no dev F1 improvement since epoch {best_epoch}")
+            break
+
+    if best_weights is not None:
+        ner.from_bytes(best_weights)
+    print(f"Best dev F1 {best_f:.3f} at epoch {best_epoch}")
+
 with nlp.disable_pipes(*unaffected_pipes):
     optimizer = nlp.begin_training()
-    for i in range (100):  # Continue training with more iterations
-        losses = {}
-        for text, annotations in TRAIN_DATA:
-            doc = nlp.make_doc(text)
-            example = Example.from_dict(doc, annotations)
-            nlp.update([example], sgd=optimizer, drop=0.25, losses=losses)
-        print(f"Iteration {i + 1}, Losses: {losses}")
+    if args.mode == "minibatch":
+        train_minibatch(optimizer)
+    else:
+        for i in range (args.iterations):  # Continue training with more iterations
+            losses = {}
+            for example in iter_examples(nlp, corpus_dir):
+                nlp.update([example], sgd=optimizer, drop=args.drop, losses=losses)
+            print(f"Iteration {i + 1}, Losses: {losses}")
+
+# Record the components inference can skip (only doc.ents is read when serving)
+excluded = mark_for_serving(nlp)
+print(f"Serving mode will exclude: {excluded}")
 
 # Save the fine-tuned model
-nlp.to_disk("./ipsee_ner_model")
+nlp.to_disk(args.output)
 
-print("Fine-tuned model saved as 'ipsee_ner_model'")
+print(f"Fine-tuned model saved as '{args.output}'")
@@ -1,15 +1,27 @@
+import argparse
+import os
+import random
 import spacy
 import torch
 import json
 import numpy as np
 import wandb
 import logging
-from spacy.training.example import Example
 from transformers import AutoModel, AutoTokenizer
 from sklearn.model_selection import KFold
 from torch.optim.lr_scheduler import ReduceLROnPlateau
 from torch.nn.utils import clip_grad_norm_
 from torch.optim import AdamW
+from corpus_cache import load_or_build_corpus, read_manifest, iter_examples
+from activation_cache import ActivationCache, TopLayersTagger, build_activation_cache, cache_name, IGNORE_INDEX
+
+parser = argparse.ArgumentParser(description="Train the ipsee NER with a transformer backbone")
+parser.add_argument("--feature-cache", action="store_true",
+                    help="run the frozen encoder layers once per document, cache their output on disk and "
+                         "train only the top layers and a tagging head from the cache")
+parser.add_argument("--cache-dtype", choices=["float16", "float32"], default="float16")
+parser.add_argument("--max-length", type=int, default=512, help="word pieces per cached window")
+args = parser.parse_args()
 
 # Set up logging for debugging and tracking
 logging.basicConfig(filename="training.log", level=logging.INFO, format='%(asctime)s:%(levelname)s:%(message)s')
@@ -57,28 +69,96 @@ def load_training_data(file_path):
 
 TRAIN_DATA = load_training_data("training_data.json")
 
-# Prepare training data
-def prepare_training_data(nlp, training_data):
+# Prepare training data (only the texts are needed; they are tokenized once into the corpus cache)
+def prepare_training_data(training_data):
     prepared_data = []
     for entry in training_data:
-        try:
-            if 'tos' in entry and 'content' in entry['tos']:
-                text = " ".join(entry['tos']['content'])
-                doc = nlp(text)
-                prepared_data.append((text, {}))
-            else:
-                logging.warning(f"Missing 'tos' content in entry: {entry}")
-        except Exception as e:
-            logging.error(f"Error preparing data: {e}")
-            continue
+        if 'tos' in entry and 'content' in entry['tos']:
+            text = " ".join(entry['tos']['content'])
+            # Entity offsets, when an entry has them, refer to the joined text
+            prepared_data.append((text, {"entities": entry["entities"]} if "entities" in entry else {}))
+        else:
+            logging.warning(f"Missing 'tos' content in entry: {entry}")
     return prepared_data
 
-TRAIN_DATA = prepare_training_data(nlp, TRAIN_DATA)
+corpus_dir = load_or_build_corpus(nlp, prepare_training_data(TRAIN_DATA))
+n_docs = read_manifest(corpus_dir)["docs"]
 
 # Cross-validation setup with KFold
 n_folds = 2
 kf = KFold(n_splits=n_folds, shuffle=True)
 
+# Feature-cache mode: the 22 frozen layers of bert-large run once per document instead of
+# once per batch, epoch and fold. Only the two unfrozen layers and a BIO tagging head are
+# trained, from the cached activations; the cache lives next to the corpus it was built from.
+def train_from_activation_cache():
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    frozen_layers = len(transformer_model.encoder.layer) - 2
+    activation_dir = os.path.join(corpus_dir, cache_name(model_name, frozen_layers, args.max_length, args.cache_dtype))
+    if not os.path.exists(os.path.join(activation_dir, "index.json")):
+        build_activation_cache(transformer_model.to(device), tokenizer, nlp, corpus_dir, activation_dir,
+                               frozen_layers, max_length=args.max_length, dtype=args.cache_dtype)
+    cache = ActivationCache(activation_dir)
+    loss_fn = torch.nn.CrossEntropyLoss(ignore_index=IGNORE_INDEX)
+    batch_size = wandb.config.batch_size
+
+    def batch_loss(tagger, windows):
+        hidden, attention_mask, tags = cache.batch(windows, device)
+        if not (tags != IGNORE_INDEX).any():
+            return None  # nothing annotated in this batch
+        logits = tagger(hidden, attention_mask)
+        return loss_fn(logits.view(-1, logits.shape[-1]), tags.view(-1))
+
+    best_overall, best_state = float('inf'), None
+    for fold, (train_idx, val_idx) in enumerate(kf.split(np.arange(n_docs))):
+        print(f"Training Fold {fold+1}/{n_folds} from cached activations...")
+        train_windows = cache.windows_for(set(train_idx.tolist()))
+        val_windows = cache.windows_for(set(val_idx.tolist()))
+        tagger = TopLayersTagger(transformer_model, frozen_layers, len(cache.tags)).to(device)
+        optimizer = AdamW(tagger.parameters(), lr=wandb.config.learning_rate)
+        fold_scheduler = ReduceLROnPlateau(optimizer, 'min', factor=0.5, patience=2)
+        best_loss, trigger_times = float('inf'), 0
+
+        for epoch in range(wandb.config.epochs):
+            tagger.train()
+            random.shuffle(train_windows)
+            train_loss = 0.0
+            for start in range(0, len(train_windows), batch_size):
+                loss = batch_loss(tagger, train_windows[start:start + batch_size])
+                if loss is None:
+                    continue
+                optimizer.zero_grad()
+                loss.backward()
+                clip_grad_norm_(tagger.parameters(), max_norm=1.0)
+                optimizer.step()
+                train_loss += loss.item()
+
+            tagger.eval()
+            val_loss = 0.0
+            with torch.no_grad():
+                for start in range(0, len(val_windows), batch_size):
+                    loss = batch_loss(tagger, val_windows[start:start + batch_size])
+                    val_loss += loss.item() if loss is not None else 0.0
+            fold_scheduler.step(val_loss)
+            wandb.log({"loss": train_loss, "val_loss": val_loss, "epoch": epoch + 1, "fold": fold + 1})
+            print(f"Epoch {epoch + 1}/{wandb.config.epochs}, Loss: {train_loss}, Val loss: {val_loss}")
+
+            if val_loss < best_loss:
+                best_loss, trigger_times = val_loss, 0
+                if val_loss < best_overall:
+                    best_overall = val_loss
+                    best_state = {name: tensor.detach().cpu().clone() for name, tensor in tagger.state_dict().items()}
+            else:
+                trigger_times += 1
+                if trigger_times >= patience:
+                    logging.info(f"Early stopping at epoch {epoch + 1} on fold {fold + 1}.")
+                    break
+
+    torch.save({"model_name": model_name, "frozen_layers": frozen_layers, "tags": cache.tags,
+                "max_length": args.max_length, "state_dict": best_state}, "./ipsee_transformer_top.pt")
+    logging.info("Top layers and tagging head saved as 'ipsee_transformer_top.pt'")
+    print("Model saved successfully!")
+
 # Separate PyTorch optimizer for the transformer model
 params = [
     {"params": transformer_model.encoder.layer[:6].parameters(), "lr": 1e-5},
@@ -96,43 +176,42 @@ best_loss = float('inf')
 patience = 5
 trigger_times = 0
 
-# Cross-validation loop
-for fold, (train_idx, val_idx) in enumerate(kf.split(TRAIN_DATA)):
-    print(f"Training Fold {fold+1}/{n_folds}...")
-    train_data = np.array(TRAIN_DATA)[train_idx]
-    val_data = np.array(TRAIN_DATA)[val_idx]
-
-    for epoch in range(wandb.config.epochs):
-        losses = {}
-        batch_size = wandb.config.batch_size
-        for batch in spacy.util.minibatch(train_data, size=batch_size):
-            texts, _ = zip(*batch)
-            examples = [Example.from_dict(nlp.make_doc(text), {}) for text in texts]
-
-            # Update the spaCy model (NER)
-            nlp.update(examples, sgd=spacy_optimizer, drop=0.25, losses=losses)
-
-            # Update the transformer model (PyTorch)
-            with torch.amp.autocast(device_type='cuda'):
-                clip_grad_norm_(transformer_model.parameters(), max_norm=1.0)
-                transformer_optimizer.step()
-
-        scheduler.step(sum(losses.values()))
-        current_loss = sum(losses.values())
-        wandb.log({"loss": current_loss, "epoch": epoch + 1, "fold": fold + 1})
-
-        if current_loss < best_loss:
-            best_loss = current_loss
-            trigger_times = 0
-        else:
-            trigger_times += 1
-            if trigger_times >= patience:
-                logging.info(f"Early stopping at epoch {epoch + 1} on fold {fold + 1}.")
-                break
+if args.feature_cache:
+    train_from_activation_cache()
+else:
+    # Cross-validation loop
+    for fold, (train_idx, val_idx) in enumerate(kf.split(np.arange(n_docs))):
+        print(f"Training Fold {fold+1}/{n_folds}...")
+        train_idx = set(train_idx.tolist())
+
+        for epoch in range(wandb.config.epochs):
+            losses = {}
+            batch_size = wandb.config.batch_size
+            for examples in spacy.util.minibatch(iter_examples(nlp, corpus_dir, train_idx), size=batch_size):
+                # Update the spaCy model (NER)
+                nlp.update(examples, sgd=spacy_optimizer, drop=0.25, losses=losses)
+
+                # Update the transformer model (PyTorch)
+                with torch.amp.autocast(device_type='cuda'):
+                    clip_grad_norm_(transformer_model.parameters(), max_norm=1.0)
+                    transformer_optimizer.step()
+
+            scheduler.step(sum(losses.values()))
+            current_loss = sum(losses.values())
+            wandb.log({"loss": current_loss, "epoch": epoch + 1, "fold": fold + 1})
+
+            if current_loss < best_loss:
+                best_loss = current_loss
+                trigger_times = 0
+            else:
+                trigger_times += 1
+                if trigger_times >= patience:
+                    logging.info(f"Early stopping at epoch {epoch + 1} on fold {fold + 1}.")
+                    break
 
-        print(f"Epoch {epoch + 1}/{wandb.config.epochs}, Loss: {current_loss}")
+            print(f"Epoch {epoch + 1}/{wandb.config.epochs}, Loss: {current_loss}")
 
-# Save the fine-tuned model
-nlp.to_disk("./ipsee_ner_model")
-logging.info("Fine-tuned model saved as 'ipsee_ner_model'")
-print("Model saved successfully!")
+    # Save the fine-tuned model
+    nlp.to_disk("./ipsee_ner_model")
+    logging.info("Fine-tuned model saved as 'ipsee_ner_model'")
+    print("Model saved successfully!")